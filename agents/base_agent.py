@@ -1,3 +1,5 @@
+import copy
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Any
 
@@ -57,6 +59,55 @@ class BaseAgent(ABC):
         """
         pass
     
+    async def select_action_async(self, game_state: Dict[str, Any], valid_actions: List[Action]) -> Action:
+        """异步选择一个动作，默认直接调用同步实现
+        
+        需要等待网络I/O的代理（如LLM代理）应覆盖此方法，以便评估时多局游戏并发执行
+        """
+        return self.select_action(game_state, valid_actions)
+    
+    async def select_gems_to_discard_async(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
+        """异步选择要丢弃的宝石，默认直接调用同步实现"""
+        return self.select_gems_to_discard(game_state, gems, num_to_discard)
+    
+    async def select_noble_async(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
+        """异步选择一个贵族，默认直接调用同步实现"""
+        return self.select_noble(game_state, available_nobles)
+    
+    def prefetch_action(self, game_state: Dict[str, Any], valid_actions: List[Action],
+                        semaphore: Optional[asyncio.Semaphore] = None) -> Optional[asyncio.Task]:
+        """根据预测的下一回合状态提前开始决策，默认不做预取
+        
+        Args:
+            game_state: 预测的游戏状态
+            valid_actions: 预测状态下的有效动作列表
+            semaphore: 限制并发决策数量的信号量，预取请求发出前应先获得许可
+            
+        Returns:
+            Optional[asyncio.Task]: 预取任务，预测失败时应通过cancel_prefetch取消；不支持预取时返回None
+        """
+        return None
+    
+    def cancel_prefetch(self, task: asyncio.Task):
+        """取消预测失败的预取任务"""
+        task.cancel()
+    
+    def for_game(self) -> "BaseAgent":
+        """返回参与一局游戏的代理实例，默认为浅拷贝
+        
+        评估时多局游戏并发进行，每局使用各自的实例，避免对局内的状态（如游戏历史）在多局之间互相干扰；
+        保存对局内状态的代理应覆盖此方法，在拷贝中重置这些状态
+        """
+        return copy.copy(self)
+    
+    def describe_config(self) -> Dict[str, Any]:
+        """描述代理的类型和影响决策的配置，评估检查点据此判断恢复时代理是否与中断前相同"""
+        return {"type": type(self).__name__, "name": self.name}
+    
+    def bind_http_session(self, session: Any):
+        """使用评估期间共享的异步HTTP连接池，session为None时解除绑定；不发起网络请求的代理无需处理"""
+        pass
+    
     def on_game_start(self, game_state: Dict[str, Any]):
         """游戏开始时的回调"""
         pass
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class BatchLLMDispatcher:
+    """LLM请求批量调度器
+    
+    将一个短时间窗口内并发提交的LLM请求合并为一批发送。如果LLM客户端实现了
+    get_completion_batch_async(prompts, temperature, max_tokens)，同一批中参数相同的
+    请求会通过一次调用提交；否则逐个并发调用get_completion_async。
+    """
+    
+    def __init__(self, llm_client: Any, window_ms: float = 50, max_batch: int = 32):
+        """初始化调度器
+        
+        Args:
+            llm_client: LLM客户端
+            window_ms: 合并请求的时间窗口(毫秒)
+            max_batch: 单批最大请求数，达到后立即发送
+        """
+        self.llm_client = llm_client
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        
+        self._pending: List[Tuple[str, str, Optional[float], Optional[int], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    async def submit(self, system_prompt: str, user_prompt: str,
+                     temperature: Optional[float] = None,
+                     max_tokens: Optional[int] = None) -> str:
+        """提交一个请求并等待其结果
+        
+        Args:
+            system_prompt: 系统提示
+            user_prompt: 用户提示
+            temperature: 温度参数
+            max_tokens: 最大生成令牌数
+        
+        Returns:
+            str: 模型生成的文本
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((system_prompt, user_prompt, temperature, max_tokens, future))
+        
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """取出当前等待中的请求并发送"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._dispatch(batch))
+    
+    async def _dispatch(self, batch: List[Tuple[str, str, Optional[float], Optional[int], asyncio.Future]]):
+        """按生成参数分组发送一批请求，并把结果交还给等待的协程"""
+        groups: Dict[Tuple[Optional[float], Optional[int]], list] = {}
+        for item in batch:
+            groups.setdefault((item[2], item[3]), []).append(item)
+        
+        await asyncio.gather(*[
+            self._dispatch_group(items, temperature, max_tokens)
+            for (temperature, max_tokens), items in groups.items()
+        ])
+    
+    async def _dispatch_group(self, items: list, temperature: Optional[float], max_tokens: Optional[int]):
+        """发送一组生成参数相同的请求"""
+        try:
+            if hasattr(self.llm_client, "get_completion_batch_async"):
+                prompts = [(system_prompt, user_prompt) for system_prompt, user_prompt, _, _, _ in items]
+                responses = await self.llm_client.get_completion_batch_async(prompts, temperature, max_tokens)
+            else:
+                responses = await asyncio.gather(*[
+                    self.llm_client.get_completion_async(system_prompt, user_prompt, temperature, max_tokens)
+                    for system_prompt, user_prompt, _, _, _ in items
+                ])
+        except Exception as e:
+            for *_, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (*_, future), response in zip(items, responses):
+            if not future.done():
+                future.set_result(response)
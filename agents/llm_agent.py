@@ -1,15 +1,168 @@
-import json
+import io
+import re
+import ast
 import time
-from typing import Dict, List, Optional, Any, Union
+import random
+import asyncio
+import hashlib
+import traceback
+from collections import Counter, OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Any, Set, Tuple, Union
 
 from agents.base_agent import BaseAgent
+from agents.batch_dispatcher import BatchLLMDispatcher
+from game.card import GemColor, STANDARD_CARDS
 from game.game import Action, ActionType, Game
+from game.serializers import from_json, to_json
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick为可选依赖，未安装时逐个进行子串查找
+    ahocorasick = None
+
+
+# 系统提示的各个片段，按本回合可用动作的类型只拼接需要的部分
+SYSTEM_PROMPT_INTRO = """
+你是一名璀璨宝石(Splendor)游戏的AI玩家。你的目标是通过策略性地收集宝石、购买卡牌和吸引贵族，尽可能快地获得15分。
+
+游戏规则:
+1. 每回合你可以执行以下操作之一:
+"""
+
+SYSTEM_RULES_GEMS = """   - 拿取3个不同颜色的宝石代币
+   - 拿取2个相同颜色的宝石代币(该颜色的代币数量至少为4个)
+"""
+
+SYSTEM_RULES_CARDS = """   - 购买一张面朝上的发展卡或预留的卡
+   - 预留一张发展卡并获得一个金色宝石(黄金)
+"""
+
+SYSTEM_RULES_GEM_LIMIT = "你最多持有10个宝石代币，超过需要丢弃"
+SYSTEM_RULES_NOBLES = "当你的发展卡达到一位贵族的要求时，该贵族会立即访问你，提供额外的胜利点数"
+SYSTEM_RULES_GAME_END = "游戏在一位玩家达到15分后，完成当前回合结束"
+
+SYSTEM_TIPS_GENERAL = """- 注意平衡短期与长期利益
+- 考虑其他玩家可能的行动
+"""
+
+SYSTEM_TIPS_CARDS = """- 关注贵族卡的要求
+- 预留对你重要或对对手有价值的卡牌
+- 留意游戏板上的卡牌分布
+"""
+
+SYSTEM_PROMPT_OUTRO = """
+你需要基于游戏状态，从可用动作中选择最佳动作。你的回应应该包含你选择的动作及简短的解释。
+"""
+
+
+def build_system_prompt(gems: bool = True, cards: bool = True) -> str:
+    """拼接系统提示
+    
+    Args:
+        gems: 是否包含拿取宝石相关的规则
+        cards: 是否包含购买、预留卡牌和贵族相关的规则与策略
+    """
+    parts = [SYSTEM_PROMPT_INTRO]
+    if gems:
+        parts.append(SYSTEM_RULES_GEMS)
+    if cards:
+        parts.append(SYSTEM_RULES_CARDS)
+    
+    rules = [SYSTEM_RULES_GEM_LIMIT]
+    if cards:
+        rules.append(SYSTEM_RULES_NOBLES)
+    rules.append(SYSTEM_RULES_GAME_END)
+    parts.append("\n")
+    parts.extend(f"{i}. {rule}\n" for i, rule in enumerate(rules, start=2))
+    
+    parts.append("\n策略提示:\n")
+    parts.append(SYSTEM_TIPS_GENERAL)
+    if cards:
+        parts.append(SYSTEM_TIPS_CARDS)
+    parts.append(SYSTEM_PROMPT_OUTRO)
+    return "".join(parts)
+
+
+# 默认系统提示（包含全部规则）
+DEFAULT_SYSTEM_PROMPT = build_system_prompt()
+
+# 拿取宝石类的动作类型，其余动作类型都与卡牌有关
+GEM_ACTION_TYPES = frozenset((ActionType.TAKE_DIFFERENT_GEMS, ActionType.TAKE_SAME_GEMS))
+
+# 按(是否有拿取宝石动作, 是否有卡牌动作)预先拼好的系统提示
+ACTION_SYSTEM_PROMPTS = {(gems, cards): build_system_prompt(gems, cards) for gems in (False, True) for cards in (False, True)}
+
+
+# 解析动作响应时查找的固定词汇（均为小写）：动作类型、宝石颜色和卡牌ID
+ACTION_VOCABULARY = frozenset([action_type.value.lower() for action_type in ActionType]
+                              + [color.value.lower() for color in GemColor]
+                              + [card.card_id.lower() for card in STANDARD_CARDS])
+
+
+def _build_vocabulary_automaton() -> Any:
+    """为固定词汇构建Aho-Corasick自动机，未安装pyahocorasick时返回None"""
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for word in ACTION_VOCABULARY:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return automaton
+
+
+# 词汇固定不变，自动机只在模块加载时构建一次
+_VOCABULARY_AUTOMATON = _build_vocabulary_automaton()
+
+
+def _find_vocabulary(text_lower: str) -> Set[str]:
+    """返回ACTION_VOCABULARY中在text_lower里出现过的词，有自动机时只需线性扫描一遍text_lower"""
+    if _VOCABULARY_AUTOMATON is None:
+        return {word for word in ACTION_VOCABULARY if word in text_lower}
+    return {word for _, word in _VOCABULARY_AUTOMATON.iter(text_lower)}
 
 
 class LLMAgent(BaseAgent):
     """使用大语言模型作为决策引擎的代理"""
     
-    def __init__(self, player_id: str, name: str, llm_client: Any, system_prompt: str = None, temperature: float = 0.5, max_tokens: int = 500):
+    # 各类提示中固定不变的部分放在最前面，使连续请求的前缀逐字节一致，便于服务端前缀缓存命中
+    ACTION_PROMPT_PREFIX = """
+请分析当前的游戏状态，并从可用动作中选择最佳动作。
+
+请选择一个动作并给出简短解释。回复格式:
+选择动作: <动作编号>
+解释: <你的解释>
+"""
+    
+    DISCARD_PROMPT_PREFIX = """
+你超过了宝石代币的持有上限(10个)，需要丢弃多余的宝石。
+
+请选择要丢弃的宝石。回复格式:
+丢弃宝石: {"<颜色1>": <数量1>, "<颜色2>": <数量2>, ...}
+解释: <你的解释>
+"""
+    
+    NOBLE_PROMPT_PREFIX = """
+你满足了多个贵族的要求，现在可以选择一位贵族访问。
+
+请选择一位贵族。回复格式:
+选择贵族: <贵族ID>
+解释: <你的解释>
+"""
+    
+    # 解析LLM响应所用的正则表达式
+    ACTION_RE = re.compile(r"选择动作:\s*(\d+)")
+    # 动作编号之后已出现其他字符，说明编号已经完整，流式生成可以就此中止
+    ACTION_COMPLETE_RE = re.compile(r"选择动作:\s*\d+\D")
+    LONE_NUMBER_RE = re.compile(r"^\s*(\d+)\s*$", re.MULTILINE)
+    DISCARD_RE = re.compile(r"丢弃宝石:\s*({.+?})", re.DOTALL)
+    NOBLE_RE = re.compile(r"选择贵族:\s*(\w+)")
+    
+    def __init__(self, player_id: str, name: str, llm_client: Any, system_prompt: str = None, temperature: float = 0.5, max_tokens: int = 500,
+                 async_llm_client: Any = None, enable_parallel_decisions: bool = False,
+                 dispatcher: Optional[BatchLLMDispatcher] = None, response_cache_size: int = 512,
+                 history_window: int = 32, record_full_history: bool = False,
+                 persistent_cache: Any = None, compact_prompts: bool = True):
         """初始化LLM代理
         
         Args:
@@ -19,9 +172,32 @@ class LLMAgent(BaseAgent):
             system_prompt: 系统提示
             temperature: 温度参数
             max_tokens: 最大生成令牌数
+            async_llm_client: 异步调用使用的LLM客户端，为None时使用llm_client
+            enable_parallel_decisions: 是否并发请求同一回合内相互独立的决策（丢弃宝石与选择贵族）
+            dispatcher: 批量调度器，提供时异步请求经由调度器合并发送
+            response_cache_size: 本地响应缓存容量，温度为0时相同提示直接复用之前的响应
+            history_window: 保留的最近游戏事件数量
+            record_full_history: 是否在游戏事件中保存完整的游戏状态（用于调试），默认只保存摘要
+            persistent_cache: 持久化响应缓存（如evaluation.llm_cache.LLMResponseCache），温度为0时跨多次运行复用响应
+            compact_prompts: 是否精简提示：选择动作时系统提示只包含与可用动作类型相关的规则（仅使用默认系统提示时），
+                游戏状态中省略空的卡牌列表
         """
         super().__init__(player_id, name)
         self.llm_client = llm_client
+        self.async_llm_client = async_llm_client if async_llm_client is not None else llm_client
+        self.enable_parallel_decisions = enable_parallel_decisions
+        self.dispatcher = dispatcher
+        self.response_cache_size = response_cache_size
+        self._response_cache: OrderedDict[str, str] = OrderedDict()
+        self.persistent_cache = persistent_cache
+        
+        # 预取中的动作决策，键为提示；已获得并发许可、开始请求的预取记录在_prefetch_started中
+        self._prefetched: Dict[str, asyncio.Task] = {}
+        self._prefetch_started: Set[str] = set()
+        
+        # 最近一次序列化的游戏状态
+        self._last_state = None
+        self._last_state_json = ""
         self.temperature = temperature
         self.max_tokens = max_tokens
         
@@ -30,80 +206,257 @@ class LLMAgent(BaseAgent):
             self.system_prompt = self._get_default_system_prompt()
         else:
             self.system_prompt = system_prompt
+        self.compact_prompts = compact_prompts
+        self._specialize_system_prompt = compact_prompts and system_prompt is None
             
-        # 保存游戏历史，用于LLM上下文
-        self.game_history = []
+        # 保存最近的游戏事件，用于LLM上下文
+        self.history_window = history_window
+        self.record_full_history = record_full_history
+        self.game_history: deque = deque(maxlen=history_window)
         
     def _get_default_system_prompt(self) -> str:
         """获取默认的系统提示"""
-        return """
-你是一名璀璨宝石(Splendor)游戏的AI玩家。你的目标是通过策略性地收集宝石、购买卡牌和吸引贵族，尽可能快地获得15分。
-
-游戏规则:
-1. 每回合你可以执行以下操作之一:
-   - 拿取3个不同颜色的宝石代币
-   - 拿取2个相同颜色的宝石代币(该颜色的代币数量至少为4个)
-   - 购买一张面朝上的发展卡或预留的卡
-   - 预留一张发展卡并获得一个金色宝石(黄金)
-
-2. 你最多持有10个宝石代币，超过需要丢弃
-3. 当你的发展卡达到一位贵族的要求时，该贵族会立即访问你，提供额外的胜利点数
-4. 游戏在一位玩家达到15分后，完成当前回合结束
-
-策略提示:
-- 注意平衡短期与长期利益
-- 考虑其他玩家可能的行动
-- 关注贵族卡的要求
-- 预留对你重要或对对手有价值的卡牌
-- 留意游戏板上的卡牌分布
-
-你需要基于游戏状态，从可用动作中选择最佳动作。你的回应应该包含你选择的动作及简短的解释。
-"""
+        return DEFAULT_SYSTEM_PROMPT
+    
+    def _action_system_prompt(self, valid_actions: List[Action]) -> str:
+        """选择动作时使用的系统提示，只包含与可用动作类型相关的规则"""
+        if not self._specialize_system_prompt:
+            return self.system_prompt
+        
+        gems = cards = False
+        for action in valid_actions:
+            if action.action_type in GEM_ACTION_TYPES:
+                gems = True
+            else:
+                cards = True
+            if gems and cards:
+                break
+        # 没有可用动作时使用完整的系统提示
+        if not (gems or cards):
+            return self.system_prompt
+        return ACTION_SYSTEM_PROMPTS[gems, cards]
     
     def select_action(self, game_state: Dict[str, Any], valid_actions: List[Action]) -> Action:
         """使用LLM选择一个动作"""
         prompt = self._construct_action_prompt(game_state, valid_actions)
+        response = self._query_llm(prompt, self._action_system_prompt(valid_actions))
+        return self._resolve_action(response, valid_actions)
+    
+    def select_gems_to_discard(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
+        """使用LLM选择要丢弃的宝石"""
+        prompt = self._construct_discard_prompt(game_state, gems, num_to_discard)
         response = self._query_llm(prompt)
+        return self._resolve_discard(response, gems, num_to_discard)
+    
+    def select_noble(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
+        """使用LLM选择一个贵族"""
+        prompt = self._construct_noble_prompt(game_state, available_nobles)
+        response = self._query_llm(prompt)
+        return self._resolve_noble(response, available_nobles)
+    
+    async def select_action_async(self, game_state: Dict[str, Any], valid_actions: List[Action]) -> Action:
+        """使用LLM异步选择一个动作"""
+        prompt = self._construct_action_prompt(game_state, valid_actions)
+        
+        # 之前按预测状态预取过同样的提示时直接使用其结果，其余未被使用的预取已经过时，全部取消
+        prefetched = self._prefetched.pop(prompt, None)
+        started = prompt in self._prefetch_started
+        self._discard_prefetches()
+        
+        # 调用方持有并发许可时，仍在等待许可的预取可能无法开始，此时取消预取并直接请求
+        if prefetched is not None and (started or prefetched.done()):
+            response = await prefetched
+        else:
+            if prefetched is not None:
+                prefetched.cancel()
+            response = await self._aquery_llm(prompt, self._action_system_prompt(valid_actions))
+        return self._resolve_action(response, valid_actions)
+    
+    async def select_action_streaming(self, game_state: Dict[str, Any], valid_actions: List[Action],
+                                      on_text: Callable[[str], None]) -> Action:
+        """流式请求LLM选择动作，生成的文本随到随交给on_text输出
+        
+        解析出完整的动作编号后立即中止生成，不再等待（也不再计费）后面的解释
+        """
+        prompt = self._construct_action_prompt(game_state, valid_actions)
+        system_prompt = self._action_system_prompt(valid_actions)
+        
+        cached = self._get_cached_response(prompt, system_prompt)
+        if cached is not None:
+            on_text(cached)
+            return self._resolve_action(cached, valid_actions)
+        
+        # 批量调度器合并发送的请求无法流式返回
+        client = self.async_llm_client
+        if self.dispatcher is not None or not hasattr(client, "stream_completion_async"):
+            response = await self._aquery_llm(prompt, system_prompt)
+            on_text(response)
+            return self._resolve_action(response, valid_actions)
+        
+        response = ""
+        stream = client.stream_completion_async(
+            system_prompt=system_prompt,
+            user_prompt=prompt,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        try:
+            async for text in stream:
+                response += text
+                on_text(text)
+                if self.ACTION_COMPLETE_RE.search(response):
+                    break
+        finally:
+            await stream.aclose()
+        
+        # 流式请求失败（如SDK不支持流式参数）时没有任何输出，改用普通请求，避免直接随机选择动作
+        if not response:
+            response = await self._aquery_llm(prompt, system_prompt)
+            on_text(response)
+            return self._resolve_action(response, valid_actions)
         
+        self._put_cached_response(prompt, response, system_prompt)
+        return self._resolve_action(response, valid_actions)
+    
+    def prefetch_action(self, game_state: Dict[str, Any], valid_actions: List[Action],
+                        semaphore: Optional[asyncio.Semaphore] = None) -> Optional[asyncio.Task]:
+        """按预测的下一回合状态提前发出请求
+        
+        之后真实回合构造出完全相同的提示时直接复用预取的响应，否则预取结果不会被使用
+        """
+        prompt = self._construct_action_prompt(game_state, valid_actions)
+        task = self._prefetched.get(prompt)
+        if task is None:
+            task = asyncio.ensure_future(self._aprefetch(prompt, self._action_system_prompt(valid_actions), semaphore))
+            self._prefetched[prompt] = task
+        return task
+    
+    async def _aprefetch(self, prompt: str, system_prompt: str, semaphore: Optional[asyncio.Semaphore]) -> str:
+        """发出预取请求，提供信号量时先获得并发许可"""
+        if semaphore is None:
+            self._prefetch_started.add(prompt)
+            return await self._aquery_llm(prompt, system_prompt)
+        
+        async with semaphore:
+            self._prefetch_started.add(prompt)
+            return await self._aquery_llm(prompt, system_prompt)
+    
+    def cancel_prefetch(self, task: asyncio.Task):
+        """取消预测失败的预取任务"""
+        for prompt, prefetched in list(self._prefetched.items()):
+            if prefetched is task:
+                del self._prefetched[prompt]
+                self._prefetch_started.discard(prompt)
+        task.cancel()
+    
+    def _discard_prefetches(self):
+        """取消并清除所有未被使用的预取任务"""
+        for task in self._prefetched.values():
+            task.cancel()
+        self._prefetched.clear()
+        self._prefetch_started.clear()
+    
+    async def select_gems_to_discard_async(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
+        """使用LLM异步选择要丢弃的宝石"""
+        prompt = self._construct_discard_prompt(game_state, gems, num_to_discard)
+        response = await self._aquery_llm(prompt)
+        return self._resolve_discard(response, gems, num_to_discard)
+    
+    async def select_noble_async(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
+        """使用LLM异步选择一个贵族"""
+        prompt = self._construct_noble_prompt(game_state, available_nobles)
+        response = await self._aquery_llm(prompt)
+        return self._resolve_noble(response, available_nobles)
+    
+    async def select_discard_and_noble_async(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int,
+                                             available_nobles: List[Dict[str, Any]]) -> Tuple[Dict[str, int], str]:
+        """同时完成丢弃宝石和选择贵族两个决策
+        
+        两个决策互不依赖，启用enable_parallel_decisions时并发请求LLM，
+        否则按顺序请求以保证结果可复现
+        
+        Returns:
+            Tuple[Dict[str, int], str]: (要丢弃的宝石, 选择的贵族ID)
+        """
+        if not self.enable_parallel_decisions:
+            discarded_gems = await self.select_gems_to_discard_async(game_state, gems, num_to_discard)
+            noble_id = await self.select_noble_async(game_state, available_nobles)
+            return discarded_gems, noble_id
+        
+        discard_prompt = self._construct_discard_prompt(game_state, gems, num_to_discard)
+        noble_prompt = self._construct_noble_prompt(game_state, available_nobles)
+        discard_response, noble_response = await asyncio.gather(
+            self._aquery_llm(discard_prompt),
+            self._aquery_llm(noble_prompt)
+        )
+        return (self._resolve_discard(discard_response, gems, num_to_discard),
+                self._resolve_noble(noble_response, available_nobles))
+    
+    def build_action_request(self, game_state: Dict[str, Any], valid_actions: List[Action]) -> Tuple[str, str]:
+        """构建选择动作的(系统提示, 用户提示)，供不经过select_action发送请求的场景（如离线批量评估）使用"""
+        return self._action_system_prompt(valid_actions), self._construct_action_prompt(game_state, valid_actions)
+    
+    def parse_action(self, response: str, valid_actions: List[Action]) -> Optional[Action]:
+        """解析LLM的动作选择响应，无法解析时返回None（不随机选择）"""
+        return self._parse_action_response(response, valid_actions)
+    
+    def for_game(self) -> "LLMAgent":
+        """拷贝共享LLM客户端和响应缓存，游戏历史、预取任务和序列化缓存各局独立"""
+        agent = super().for_game()
+        agent._prefetched = {}
+        agent._prefetch_started = set()
+        agent._last_state = None
+        agent._last_state_json = ""
+        agent.game_history = deque(maxlen=self.history_window)
+        return agent
+    
+    def describe_config(self) -> Dict[str, Any]:
+        """在类型和名称之外加上模型、生成参数和系统提示的摘要"""
+        config = super().describe_config()
+        config.update({
+            "model": getattr(self.llm_client, "model_name", None),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "system_prompt": hashlib.blake2b(self.system_prompt.encode("utf-8"), digest_size=8).hexdigest()
+        })
+        return config
+    
+    def bind_http_session(self, session: Any):
+        """让异步请求使用的LLM客户端复用共享的HTTP连接池"""
+        clients = [self.async_llm_client]
+        if self.dispatcher is not None:
+            clients.append(self.dispatcher.llm_client)
+        
+        for client in {id(client): client for client in clients}.values():
+            if hasattr(client, "bind_http_session"):
+                client.bind_http_session(session)
+    
+    def _resolve_action(self, response: str, valid_actions: List[Action]) -> Action:
+        """根据LLM响应确定动作"""
         # 解析LLM响应
         selected_action = self._parse_action_response(response, valid_actions)
         
         # 如果无法解析，则随机选择一个动作
         if not selected_action and valid_actions:
-            import random
             selected_action = random.choice(valid_actions)
         
         return selected_action
     
-    def select_gems_to_discard(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
-        """使用LLM选择要丢弃的宝石"""
-        prompt = self._construct_discard_prompt(game_state, gems, num_to_discard)
-        response = self._query_llm(prompt)
-        
+    def _resolve_discard(self, response: str, gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
+        """根据LLM响应确定要丢弃的宝石"""
         # 解析LLM响应
         discarded_gems = self._parse_discard_response(response, gems, num_to_discard)
         
         # 如果无法解析，则随机丢弃
         if not discarded_gems:
-            import random
-            discarded_gems = {}
-            colors = [color for color, count in gems.items() if count > 0]
-            for _ in range(num_to_discard):
-                if not colors:
-                    break
-                color = random.choice(colors)
-                discarded_gems[color] = discarded_gems.get(color, 0) + 1
-                gems[color] -= 1
-                if gems[color] <= 0:
-                    colors.remove(color)
+            # 从展开后的宝石代币中不放回地抽取，不修改传入的gems
+            pool = [color for color, count in gems.items() for _ in range(max(count, 0))]
+            discarded_gems = dict(Counter(random.sample(pool, min(num_to_discard, len(pool)))))
         
         return discarded_gems
     
-    def select_noble(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
-        """使用LLM选择一个贵族"""
-        prompt = self._construct_noble_prompt(game_state, available_nobles)
-        response = self._query_llm(prompt)
-        
+    def _resolve_noble(self, response: str, available_nobles: List[Dict[str, Any]]) -> str:
+        """根据LLM响应确定贵族"""
         # 解析LLM响应
         noble_id = self._parse_noble_response(response, available_nobles)
         
@@ -115,74 +468,129 @@ class LLMAgent(BaseAgent):
     
     def _construct_action_prompt(self, game_state: Dict[str, Any], valid_actions: List[Action]) -> str:
         """构建选择动作的提示"""
-        # 转换游戏状态为易于理解的格式
-        formatted_state = json.dumps(game_state, indent=2, ensure_ascii=False)
-        
-        # 格式化有效动作
-        formatted_actions = []
+        # 构建提示：固定说明在前，每回合变化的状态和动作在后；
+        # 各部分依次写入同一个缓冲区，不为每个动作生成中间字符串列表
+        buf = io.StringIO()
+        buf.write(self.ACTION_PROMPT_PREFIX)
+        buf.write("\n当前游戏状态:\n")
+        buf.write(self._format_state(game_state))
+        buf.write("\n\n可用动作:\n")
         for i, action in enumerate(valid_actions):
-            formatted_actions.append(f"动作 {i+1}: {str(action)}")
-        
-        formatted_actions_str = "\n".join(formatted_actions)
-        
-        # 构建提示
-        prompt = f"""
-请分析当前的游戏状态，并从以下可用动作中选择最佳动作。
-
-当前游戏状态:
-{formatted_state}
-
-可用动作:
-{formatted_actions_str}
-
-请选择一个动作并给出简短解释。回复格式:
-选择动作: <动作编号>
-解释: <你的解释>
-"""
-        return prompt
+            if i:
+                buf.write("\n")
+            buf.write(f"动作 {i+1}: {action}")
+        buf.write("\n")
+        return buf.getvalue()
     
     def _construct_discard_prompt(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> str:
         """构建丢弃宝石的提示"""
-        formatted_state = json.dumps(game_state, indent=2, ensure_ascii=False)
-        formatted_gems = json.dumps(gems, indent=2, ensure_ascii=False)
+        formatted_state = self._format_state(game_state)
+        formatted_gems = to_json(gems)
         
-        prompt = f"""
-你需要丢弃 {num_to_discard} 个宝石代币，因为你超过了持有上限(10个)。
+        prompt = f"""{self.DISCARD_PROMPT_PREFIX}
+你需要丢弃 {num_to_discard} 个宝石代币。
 
 当前游戏状态:
 {formatted_state}
 
 你当前持有的宝石:
 {formatted_gems}
-
-请选择要丢弃的宝石。回复格式:
-丢弃宝石: {{"<颜色1>": <数量1>, "<颜色2>": <数量2>, ...}}
-解释: <你的解释>
 """
         return prompt
     
     def _construct_noble_prompt(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
         """构建选择贵族的提示"""
-        formatted_state = json.dumps(game_state, indent=2, ensure_ascii=False)
-        formatted_nobles = json.dumps(available_nobles, indent=2, ensure_ascii=False)
+        formatted_state = self._format_state(game_state)
+        formatted_nobles = to_json(available_nobles)
         
-        prompt = f"""
-你满足了多个贵族的要求，现在可以选择一位贵族访问。
-
+        prompt = f"""{self.NOBLE_PROMPT_PREFIX}
 当前游戏状态:
 {formatted_state}
 
 可选贵族:
 {formatted_nobles}
-
-请选择一位贵族。回复格式:
-选择贵族: <贵族ID>
-解释: <你的解释>
 """
         return prompt
     
-    def _query_llm(self, prompt: str) -> str:
-        """调用LLM获取响应"""
+    def _format_state(self, game_state: Dict[str, Any]) -> str:
+        """序列化游戏状态；同一回合内的多次决策共用同一个状态对象，只需序列化一次"""
+        if game_state is not self._last_state:
+            self._last_state = game_state
+            self._last_state_json = to_json(self._compact_state(game_state) if self.compact_prompts else game_state)
+        return self._last_state_json
+    
+    @staticmethod
+    def _compact_state(game_state: Dict[str, Any]) -> Dict[str, Any]:
+        """省略游戏状态中空的卡牌和贵族列表（如已发完的卡牌等级），不修改原状态"""
+        compact = dict(game_state)
+        compact["players"] = [
+            {key: value for key, value in player.items() if not (isinstance(value, list) and not value)}
+            for player in game_state["players"]
+        ]
+        board = dict(game_state["board"])
+        board["displayed_cards"] = {level: cards for level, cards in board["displayed_cards"].items() if cards}
+        compact["board"] = board
+        return compact
+    
+    def _get_cached_response(self, prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+        """查询本地响应缓存，仅在温度为0（输出确定）时启用；system_prompt为None时使用self.system_prompt"""
+        if self.temperature != 0 or self.response_cache_size <= 0:
+            return None
+        key = self._response_cache_key(prompt, system_prompt)
+        response = self._response_cache.get(key)
+        if response is not None:
+            self._response_cache.move_to_end(key)
+            return response
+        
+        # 本地缓存未命中时查询持久化缓存
+        if self.persistent_cache is not None:
+            response = self.persistent_cache.get(self._persistent_cache_key(prompt, system_prompt))
+            if response is not None:
+                self._put_memory_cached_response(key, response)
+        return response
+    
+    def _put_cached_response(self, prompt: str, response: str, system_prompt: Optional[str] = None):
+        """写入本地响应缓存，超出容量时淘汰最久未使用的条目"""
+        if self.temperature != 0 or self.response_cache_size <= 0 or not response:
+            return
+        self._put_memory_cached_response(self._response_cache_key(prompt, system_prompt), response)
+        if self.persistent_cache is not None:
+            self.persistent_cache.set(self._persistent_cache_key(prompt, system_prompt), response)
+    
+    def _put_memory_cached_response(self, key: str, response: str):
+        """写入内存中的响应缓存"""
+        self._response_cache[key] = response
+        while len(self._response_cache) > self.response_cache_size:
+            self._response_cache.popitem(last=False)
+    
+    def _response_cache_key(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """计算响应缓存的键"""
+        if system_prompt is None:
+            system_prompt = self.system_prompt
+        return hashlib.blake2b(f"{system_prompt}\0{prompt}".encode("utf-8")).hexdigest()
+    
+    def _persistent_cache_key(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """计算持久化缓存的键，不同模型的响应分开保存"""
+        if system_prompt is None:
+            system_prompt = self.system_prompt
+        model = getattr(self.llm_client, "model_name", type(self.llm_client).__name__)
+        return self.persistent_cache.make_key(model, self.temperature, self.max_tokens, system_prompt, prompt)
+    
+    def _query_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """调用LLM获取响应；system_prompt为None时使用self.system_prompt"""
+        cached = self._get_cached_response(prompt, system_prompt)
+        if cached is not None:
+            return cached
+        
+        response = self._request_llm(prompt, system_prompt)
+        self._put_cached_response(prompt, response, system_prompt)
+        return response
+    
+    def _request_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """向LLM客户端发送请求"""
+        if system_prompt is None:
+            system_prompt = self.system_prompt
+        
         try:
             print(f"正在向LLM发送请求，类型: {type(self.llm_client).__name__}")
             
@@ -190,7 +598,7 @@ class LLMAgent(BaseAgent):
             if hasattr(self.llm_client, "get_completion"):
                 print(f"使用get_completion方法")
                 response = self.llm_client.get_completion(
-                    system_prompt=self.system_prompt,
+                    system_prompt=system_prompt,
                     user_prompt=prompt,
                     temperature=self.temperature,
                     max_tokens=self.max_tokens
@@ -203,7 +611,7 @@ class LLMAgent(BaseAgent):
             elif hasattr(self.llm_client, "generate"):
                 print(f"使用generate方法")
                 response = self.llm_client.generate(
-                    system_prompt=self.system_prompt,
+                    system_prompt=system_prompt,
                     prompt=prompt,
                     temperature=self.temperature,
                     max_tokens=self.max_tokens
@@ -220,7 +628,49 @@ class LLMAgent(BaseAgent):
                 
         except Exception as e:
             print(f"LLM调用出错: {e}")
-            import traceback
+            print(traceback.format_exc())
+            return ""
+    
+    async def _aquery_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """异步调用LLM获取响应；system_prompt为None时使用self.system_prompt"""
+        cached = self._get_cached_response(prompt, system_prompt)
+        if cached is not None:
+            return cached
+        
+        response = await self._arequest_llm(prompt, system_prompt)
+        self._put_cached_response(prompt, response, system_prompt)
+        return response
+    
+    async def _arequest_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """向LLM客户端发送异步请求"""
+        client = self.async_llm_client
+        if system_prompt is None:
+            system_prompt = self.system_prompt
+        
+        # 不支持异步接口的客户端在线程中执行同步调用
+        if self.dispatcher is None and not hasattr(client, "get_completion_async"):
+            return await asyncio.to_thread(self._request_llm, prompt, system_prompt)
+        
+        try:
+            if self.dispatcher is not None:
+                response = await self.dispatcher.submit(
+                    system_prompt=system_prompt,
+                    user_prompt=prompt,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens
+                )
+            else:
+                response = await client.get_completion_async(
+                    system_prompt=system_prompt,
+                    user_prompt=prompt,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens
+                )
+            if not response:
+                print("警告: LLM返回了空响应")
+            return response
+        except Exception as e:
+            print(f"LLM调用出错: {e}")
             print(traceback.format_exc())
             return ""
     
@@ -228,46 +678,48 @@ class LLMAgent(BaseAgent):
         """解析LLM的动作选择响应"""
         try:
             # 查找动作编号
-            import re
-            
             # 尝试匹配"选择动作: <数字>"格式
-            match = re.search(r"选择动作:\s*(\d+)", response)
+            match = self.ACTION_RE.search(response)
             if match:
                 action_index = int(match.group(1)) - 1
                 if 0 <= action_index < len(valid_actions):
                     return valid_actions[action_index]
             
             # 尝试匹配单独的数字
-            match = re.search(r"^\s*(\d+)\s*$", response, re.MULTILINE)
+            match = self.LONE_NUMBER_RE.search(response)
             if match:
                 action_index = int(match.group(1)) - 1
                 if 0 <= action_index < len(valid_actions):
                     return valid_actions[action_index]
             
+            # 响应只转换一次小写，供下面的子串匹配复用
+            response_lower = response.lower()
+            
+            # 一次扫描找出响应中出现的动作类型、颜色和卡牌ID
+            found = _find_vocabulary(response_lower)
+            
             # 尝试基于动作描述匹配
             for action in valid_actions:
-                action_str = str(action).lower()
-                if action_str in response.lower():
+                if str(action).lower() in response_lower:
                     return action
             
             # 基于动作类型和参数匹配
             for action in valid_actions:
-                action_type = action.action_type.value
-                if action_type in response.lower():
+                if action.action_type.value in found:
                     # 进一步匹配参数
                     if action.action_type == ActionType.TAKE_DIFFERENT_GEMS:
-                        colors = [color.value for color in action.params.get("colors", [])]
-                        if all(color.lower() in response.lower() for color in colors):
+                        colors = [color.value.lower() for color in action.params.get("colors", [])]
+                        if all(color in found for color in colors):
                             return action
                     
                     elif action.action_type == ActionType.TAKE_SAME_GEMS:
-                        color = action.params.get("color").value
-                        if color.lower() in response.lower():
+                        if action.params.get("color").value.lower() in found:
                             return action
                     
                     elif action.action_type in [ActionType.RESERVE_CARD, ActionType.BUY_CARD, ActionType.BUY_RESERVED_CARD]:
+                        # 卡牌ID区分大小写，小写词汇命中后再在原始响应中确认；从牌堆预留的动作没有卡牌ID
                         card_id = action.params.get("card_id", "")
-                        if card_id in response:
+                        if not card_id or (card_id.lower() in found and card_id in response):
                             return action
             
             return None
@@ -279,16 +731,15 @@ class LLMAgent(BaseAgent):
         """解析LLM的丢弃宝石响应"""
         try:
             # 提取JSON格式的丢弃宝石信息
-            import re
-            import json
-            
             # 尝试匹配JSON对象
-            match = re.search(r"丢弃宝石:\s*({.+?})", response, re.DOTALL)
+            match = self.DISCARD_RE.search(response)
             if match:
                 json_str = match.group(1)
-                # 清理可能的非法字符
-                json_str = json_str.replace("'", "\"")
-                discard_gems = json.loads(json_str)
+                try:
+                    discard_gems = from_json(json_str)
+                except ValueError:
+                    # LLM有时会输出单引号的Python字典写法
+                    discard_gems = ast.literal_eval(json_str)
                 
                 # 验证丢弃数量
                 total_discarded = sum(discard_gems.values())
@@ -311,10 +762,8 @@ class LLMAgent(BaseAgent):
         """解析LLM的选择贵族响应"""
         try:
             # 查找贵族ID
-            import re
-            
             # 尝试匹配"选择贵族: <ID>"格式
-            match = re.search(r"选择贵族:\s*(\w+)", response)
+            match = self.NOBLE_RE.search(response)
             if match:
                 noble_id = match.group(1)
                 # 验证贵族ID是否有效
@@ -332,34 +781,35 @@ class LLMAgent(BaseAgent):
             print(f"解析选择贵族响应出错: {e}")
             return None
     
+    def _record_event(self, event: str, game_state: Dict[str, Any], **details):
+        """记录一条游戏事件，默认只保存回合数和自己的分数等摘要信息"""
+        entry = {"event": event, "round": game_state.get("round")}
+        
+        if self.record_full_history:
+            entry["state"] = game_state
+        else:
+            entry["score"] = next(
+                (player["score"] for player in game_state.get("players", []) if player.get("player_id") == self.player_id),
+                None
+            )
+        
+        entry.update(details)
+        self.game_history.append(entry)
+    
     def on_game_start(self, game_state: Dict[str, Any]):
         """游戏开始时的回调"""
-        self.game_history = []
-        self.game_history.append({
-            "event": "game_start",
-            "state": game_state
-        })
+        self.game_history.clear()
+        self._record_event("game_start", game_state)
     
     def on_game_end(self, game_state: Dict[str, Any], winners: List[str]):
         """游戏结束时的回调"""
-        self.game_history.append({
-            "event": "game_end",
-            "state": game_state,
-            "winners": winners
-        })
+        self._discard_prefetches()
+        self._record_event("game_end", game_state, winners=winners)
     
     def on_turn_start(self, game_state: Dict[str, Any]):
         """回合开始时的回调"""
-        self.game_history.append({
-            "event": "turn_start",
-            "state": game_state
-        })
+        self._record_event("turn_start", game_state)
     
     def on_turn_end(self, game_state: Dict[str, Any], action: Action, success: bool):
         """回合结束时的回调"""
-        self.game_history.append({
-            "event": "turn_end",
-            "state": game_state,
-            "action": str(action),
-            "success": success
-        }) 
\ No newline at end of file
+        self._record_event("turn_end", game_state, action=str(action), success=success)
\ No newline at end of file
@@ -0,0 +1,32 @@
+import random
+from typing import Dict, List, Any
+
+import numpy as np
+
+from agents.base_agent import BaseAgent
+
+
+class RandomAgent(BaseAgent):
+    """随机代理，随机选择动作"""
+    
+    def select_action(self, game_state: Dict[str, Any], valid_actions: List[Any]) -> Any:
+        """随机选择一个动作"""
+        return random.choice(valid_actions) if valid_actions else None
+    
+    def select_gems_to_discard(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
+        """随机选择要丢弃的宝石，每个宝石代币被丢弃的机会相同"""
+        # 一次多元超几何抽样得到各颜色的丢弃数量，不超过持有数量，无需逐个抽取
+        colors = list(gems)
+        counts = np.fromiter(gems.values(), dtype=np.int64, count=len(colors))
+        num_to_discard = min(num_to_discard, int(counts.sum()))
+        if num_to_discard <= 0:
+            return {}
+        
+        # numpy生成器的种子取自random模块，设置random的种子即可复现所有随机选择
+        rng = np.random.default_rng(random.getrandbits(64))
+        discarded = rng.multivariate_hypergeometric(counts, num_to_discard)
+        return {colors[i]: int(discarded[i]) for i in np.flatnonzero(discarded).tolist()}
+    
+    def select_noble(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
+        """随机选择一个贵族"""
+        return random.choice(available_nobles)["id"] if available_nobles else None
\ No newline at end of file
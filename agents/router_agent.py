@@ -0,0 +1,118 @@
+import asyncio
+from typing import Dict, List, Optional, Any
+
+from agents.base_agent import BaseAgent
+from agents.llm_agent import LLMAgent
+from game.game import Action
+
+
+class RouterAgent(BaseAgent):
+    """按决策难度在大小两个LLM代理之间路由的代理
+    
+    只有一个有效动作时直接返回，不请求LLM；有效动作不超过simple_action_threshold个时交给小模型；
+    丢弃宝石和选择贵族几乎是确定性的决策，总是交给小模型。未提供小模型时这些决策仍由主模型完成
+    """
+    
+    def __init__(self, primary: LLMAgent, small: Optional[LLMAgent] = None, simple_action_threshold: int = 2):
+        """初始化路由代理
+        
+        Args:
+            primary: 处理复杂回合的主模型代理，其玩家ID和名称作为路由代理的ID和名称
+            small: 处理简单决策的小模型代理
+            simple_action_threshold: 有效动作数量不超过该值时视为简单回合
+        """
+        super().__init__(primary.player_id, primary.name)
+        self.primary = primary
+        self.small = small
+        self.simple_action_threshold = simple_action_threshold
+    
+    @property
+    def llm_client(self) -> Any:
+        """主模型的LLM客户端"""
+        return self.primary.llm_client
+    
+    def _agents(self) -> List[LLMAgent]:
+        """被路由的所有代理"""
+        return [self.primary] if self.small is None else [self.primary, self.small]
+    
+    def _route_action(self, valid_actions: List[Action]) -> LLMAgent:
+        """为动作选择决策挑选代理"""
+        if self.small is not None and len(valid_actions) <= self.simple_action_threshold:
+            return self.small
+        return self.primary
+    
+    def _simple_agent(self) -> LLMAgent:
+        """处理丢弃宝石和选择贵族的代理"""
+        return self.small if self.small is not None else self.primary
+    
+    def select_action(self, game_state: Dict[str, Any], valid_actions: List[Action]) -> Action:
+        if len(valid_actions) == 1:
+            return valid_actions[0]
+        return self._route_action(valid_actions).select_action(game_state, valid_actions)
+    
+    def select_gems_to_discard(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
+        return self._simple_agent().select_gems_to_discard(game_state, gems, num_to_discard)
+    
+    def select_noble(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
+        if len(available_nobles) == 1:
+            return available_nobles[0]["id"]
+        return self._simple_agent().select_noble(game_state, available_nobles)
+    
+    async def select_action_async(self, game_state: Dict[str, Any], valid_actions: List[Action]) -> Action:
+        if len(valid_actions) == 1:
+            return valid_actions[0]
+        return await self._route_action(valid_actions).select_action_async(game_state, valid_actions)
+    
+    async def select_gems_to_discard_async(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
+        return await self._simple_agent().select_gems_to_discard_async(game_state, gems, num_to_discard)
+    
+    async def select_noble_async(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
+        if len(available_nobles) == 1:
+            return available_nobles[0]["id"]
+        return await self._simple_agent().select_noble_async(game_state, available_nobles)
+    
+    def prefetch_action(self, game_state: Dict[str, Any], valid_actions: List[Action],
+                        semaphore: Optional[asyncio.Semaphore] = None) -> Optional[asyncio.Task]:
+        """只有一个有效动作时无需预取，否则由路由到的代理预取"""
+        if len(valid_actions) == 1:
+            return None
+        return self._route_action(valid_actions).prefetch_action(game_state, valid_actions, semaphore)
+    
+    def cancel_prefetch(self, task: asyncio.Task):
+        for agent in self._agents():
+            agent.cancel_prefetch(task)
+    
+    def for_game(self) -> "RouterAgent":
+        agent = super().for_game()
+        agent.primary = self.primary.for_game()
+        agent.small = self.small.for_game() if self.small is not None else None
+        return agent
+    
+    def describe_config(self) -> Dict[str, Any]:
+        config = super().describe_config()
+        config.update({
+            "primary": self.primary.describe_config(),
+            "small": self.small.describe_config() if self.small is not None else None,
+            "simple_action_threshold": self.simple_action_threshold
+        })
+        return config
+    
+    def bind_http_session(self, session: Any):
+        for agent in self._agents():
+            agent.bind_http_session(session)
+    
+    def on_game_start(self, game_state: Dict[str, Any]):
+        for agent in self._agents():
+            agent.on_game_start(game_state)
+    
+    def on_game_end(self, game_state: Dict[str, Any], winners: List[str]):
+        for agent in self._agents():
+            agent.on_game_end(game_state, winners)
+    
+    def on_turn_start(self, game_state: Dict[str, Any]):
+        for agent in self._agents():
+            agent.on_turn_start(game_state)
+    
+    def on_turn_end(self, game_state: Dict[str, Any], action: Action, success: bool):
+        for agent in self._agents():
+            agent.on_turn_end(game_state, action, success)
\ No newline at end of file
@@ -1,28 +1,48 @@
-import json
 import time
 import os
+import copy
 import random
-from typing import Dict, List, Any, Tuple
-from collections import defaultdict
+import pickle
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Tuple
 
-from game.game import Game
+import numpy as np
+
+from game.game import Action, ActionType, Game
 from game.player import Player
+from game.serializers import to_json_bytes, from_json
 from agents.base_agent import BaseAgent
+from utils.llm_factory import create_async_http_session
 
 
 class Evaluator:
     """评估系统，用于评估不同代理的表现"""
     
-    def __init__(self, agents: List[BaseAgent], num_games: int = 10, seed: int = None):
+    def __init__(self, agents: List[BaseAgent], num_games: int = 10, seed: int = None, max_concurrency: int = 4,
+                 speculative_prefetch: bool = False, checkpoint_file: Optional[str] = "evaluation_checkpoint.json",
+                 processes: int = 1):
         """初始化评估系统
         
         Args:
             agents: 要评估的代理列表
             num_games: 评估游戏数量
             seed: 随机种子
+            max_concurrency: 同时等待中的代理决策（LLM调用）数量上限
+            speculative_prefetch: 是否在等待当前玩家决策时，按预测的动作为下一位玩家预取决策
+            checkpoint_file: 输出目录下的检查点文件名，每完成一局游戏更新一次，评估中断后重新运行时跳过已完成的游戏；
+                为None时不使用检查点
+            processes: 运行游戏的进程数量，大于1时把游戏分配到多个进程中并行模拟；只适用于可以序列化的代理
+                （如随机代理），持有网络连接的LLM代理仍在当前进程内并发运行
         """
         self.agents = agents
         self.num_games = num_games
+        self.seed = seed
+        self.max_concurrency = max_concurrency
+        self.speculative_prefetch = speculative_prefetch
+        self.checkpoint_file = checkpoint_file
+        self.processes = processes
         
         if seed is not None:
             random.seed(seed)
@@ -41,11 +61,29 @@ class Evaluator:
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         
-        # 运行指定数量的游戏
-        for game_idx in range(self.num_games):
+        # 预先生成每局游戏的种子和座位顺序，避免并发执行时争用全局随机数
+        game_setups = []
+        for _ in range(self.num_games):
             game_seed = random.randint(0, 10000)
-            game_results = self._run_game(game_idx, game_seed)
-            self.results["games"].append(game_results)
+            shuffled_agents = list(self.agents)
+            random.shuffle(shuffled_agents)
+            game_setups.append((game_seed, shuffled_agents))
+        
+        # 存在上次中断留下的检查点时，沿用其中的游戏设置并跳过已完成的游戏
+        checkpoint_path = os.path.join(output_dir, self.checkpoint_file) if self.checkpoint_file else None
+        completed: Dict[int, Dict[str, Any]] = {}
+        if checkpoint_path is not None:
+            checkpoint = self._load_checkpoint(checkpoint_path)
+            if checkpoint is not None:
+                game_setups, completed = checkpoint
+                print(f"从检查点恢复评估，已完成 {len(completed)}/{self.num_games} 局游戏")
+        
+        # 并发运行尚未完成的游戏；代理不涉及网络请求时游戏模拟是CPU密集的，分配到多个进程中运行
+        if self.processes > 1 and self._agents_picklable():
+            game_results = self._run_games_in_processes(game_setups, completed, checkpoint_path)
+        else:
+            game_results = asyncio.run(self._arun_games(game_setups, completed, checkpoint_path))
+        self.results["games"].extend(game_results)
         
         # 生成汇总结果
         self._generate_summary()
@@ -53,35 +91,159 @@ class Evaluator:
         # 保存结果
         timestamp = int(time.time())
         result_file = os.path.join(output_dir, f"evaluation_{timestamp}.json")
-        with open(result_file, "w", encoding="utf-8") as f:
-            json.dump(self.results, f, ensure_ascii=False, indent=2)
+        with open(result_file, "wb") as f:
+            f.write(to_json_bytes(self.results))
+        
+        # 评估已完整结束，不再需要检查点
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
         
         return self.results
     
-    def _run_game(self, game_idx: int, seed: int) -> Dict[str, Any]:
+    def _load_checkpoint(self, checkpoint_path: str) -> Optional[Tuple[List[Tuple[int, List[BaseAgent]]], Dict[int, Dict[str, Any]]]]:
+        """读取检查点，文件不存在或与当前评估的种子、游戏数量、代理（包括其模型和配置）不一致时返回None
+        
+        Returns:
+            Optional[Tuple[List[Tuple[int, List[BaseAgent]]], Dict[int, Dict[str, Any]]]]: (游戏设置, 已完成游戏的结果)
+        """
+        if not os.path.exists(checkpoint_path):
+            return None
+        
+        with open(checkpoint_path, "rb") as f:
+            checkpoint = from_json(f.read())
+        
+        # 评估中的代理ID是固定的，更换模型或配置后ID不变，因此还要比较各代理的配置
+        agents_by_id = {agent.player_id: agent for agent in self.agents}
+        if (checkpoint.get("num_games") != self.num_games or checkpoint.get("seed") != self.seed
+                or sorted(checkpoint.get("agents", [])) != sorted(agents_by_id)
+                or checkpoint.get("agent_configs") != self._agent_configs()):
+            print("检查点与当前评估设置不一致，忽略检查点")
+            return None
+        
+        game_setups = [(seed, [agents_by_id[player_id] for player_id in seat_order])
+                       for seed, seat_order in checkpoint["setups"]]
+        completed = {int(game_idx): result for game_idx, result in checkpoint["games"].items()}
+        return game_setups, completed
+    
+    def _save_checkpoint(self, checkpoint_path: str, game_setups: List[Tuple[int, List[BaseAgent]]],
+                         completed: Dict[int, Dict[str, Any]]):
+        """保存检查点，先写临时文件再替换，避免中断时留下不完整的文件"""
+        checkpoint = {
+            "num_games": self.num_games,
+            "seed": self.seed,
+            "agents": [agent.player_id for agent in self.agents],
+            "agent_configs": self._agent_configs(),
+            "setups": [[seed, [agent.player_id for agent in seat_order]] for seed, seat_order in game_setups],
+            "games": {str(game_idx): result for game_idx, result in completed.items()}
+        }
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(to_json_bytes(checkpoint, indent=False))
+        os.replace(tmp_path, checkpoint_path)
+    
+    def _agent_configs(self) -> Dict[str, Dict[str, Any]]:
+        """各代理的配置描述，键为玩家ID"""
+        return {agent.player_id: agent.describe_config() for agent in self.agents}
+    
+    def _agents_picklable(self) -> bool:
+        """代理能否序列化后发送到子进程，持有客户端连接、锁等资源的代理无法序列化"""
+        try:
+            pickle.dumps(self.agents)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f"代理无法发送到子进程（{e}），改为在当前进程内并发运行游戏")
+            return False
+        return True
+    
+    def _run_games_in_processes(self, game_setups: List[Tuple[int, List[BaseAgent]]], completed: Dict[int, Dict[str, Any]],
+                                checkpoint_path: Optional[str]) -> List[Dict[str, Any]]:
+        """在进程池中运行所有尚未完成的游戏，每局游戏在子进程中使用代理的副本
+        
+        Args:
+            game_setups: 每局游戏的(随机种子, 座位顺序)列表
+            completed: 已完成游戏的结果，按游戏索引保存，新完成的游戏会加入其中
+            checkpoint_path: 检查点文件路径，为None时不保存检查点
+            
+        Returns:
+            List[Dict[str, Any]]: 按游戏索引排序的游戏结果
+        """
+        # 使用spawn启动子进程，避免fork出的子进程继承相同的随机数状态，使各进程中随机代理的选择完全一致
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=context) as executor:
+            futures = {
+                executor.submit(_play_one_game, game_idx, seed, shuffled_agents, self.num_games, self.speculative_prefetch): game_idx
+                for game_idx, (seed, shuffled_agents) in enumerate(game_setups)
+                if game_idx not in completed
+            }
+            for future in as_completed(futures):
+                completed[futures[future]] = future.result()
+                if checkpoint_path is not None:
+                    self._save_checkpoint(checkpoint_path, game_setups, completed)
+        
+        return [completed[game_idx] for game_idx in sorted(completed)]
+    
+    async def _arun_games(self, game_setups: List[Tuple[int, List[BaseAgent]]], completed: Dict[int, Dict[str, Any]],
+                          checkpoint_path: Optional[str]) -> List[Dict[str, Any]]:
+        """并发运行所有尚未完成的游戏
+        
+        Args:
+            game_setups: 每局游戏的(随机种子, 座位顺序)列表
+            completed: 已完成游戏的结果，按游戏索引保存，新完成的游戏会加入其中
+            checkpoint_path: 检查点文件路径，为None时不保存检查点
+            
+        Returns:
+            List[Dict[str, Any]]: 按游戏索引排序的游戏结果
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        checkpoint_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        
+        async def run_and_checkpoint(game_idx: int, seed: int, shuffled_agents: List[BaseAgent]):
+            completed[game_idx] = await self._arun_game(game_idx, seed, shuffled_agents, semaphore)
+            if checkpoint_path is not None:
+                # 检查点写入放到线程池中执行，加锁保证同一时刻只有一次写入
+                async with checkpoint_lock:
+                    await loop.run_in_executor(None, self._save_checkpoint, checkpoint_path, game_setups, dict(completed))
+        
+        # 所有代理共享同一个HTTP连接池，复用keep-alive连接，避免每次请求重新握手
+        async with create_async_http_session() as session:
+            for agent in self.agents:
+                agent.bind_http_session(session)
+            
+            try:
+                await asyncio.gather(*[
+                    run_and_checkpoint(game_idx, seed, shuffled_agents)
+                    for game_idx, (seed, shuffled_agents) in enumerate(game_setups)
+                    if game_idx not in completed
+                ])
+            finally:
+                for agent in self.agents:
+                    agent.bind_http_session(None)
+        
+        return [completed[game_idx] for game_idx in sorted(completed)]
+    
+    async def _arun_game(self, game_idx: int, seed: int, shuffled_agents: List[BaseAgent], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
         """运行单个游戏并收集结果
         
         Args:
             game_idx: 游戏索引
             seed: 随机种子
+            shuffled_agents: 随机排序后的代理，避免先手优势
+            semaphore: 限制并发代理决策数量的信号量
             
         Returns:
             Dict[str, Any]: 游戏结果
         """
         print(f"正在运行游戏 {game_idx+1}/{self.num_games}...")
         
-        # 随机排序代理，避免先手优势
-        shuffled_agents = list(self.agents)
-        random.shuffle(shuffled_agents)
+        # 多局游戏并发进行，每局使用各自的代理实例，游戏历史等对局内的状态不会在多局之间交错
+        shuffled_agents = [agent.for_game() for agent in shuffled_agents]
         
         # 创建玩家
         players = []
-        for i, agent in enumerate(shuffled_agents):
+        for agent in shuffled_agents:
             player = Player(agent.player_id, agent.name)
             players.append(player)
-            
-            # 保存玩家和代理的映射关系
-            agent._player = player
+        player_to_agent: Dict[str, BaseAgent] = {agent.player_id: agent for agent in shuffled_agents}
         
         # 创建游戏
         game = Game(players, seed=seed)
@@ -91,32 +253,56 @@ class Evaluator:
         for agent in shuffled_agents:
             agent.on_game_start(game_state)
         
-        # 运行游戏直到结束
-        while not game.game_over:
-            current_player = game.get_current_player()
-            current_agent = next((a for a in shuffled_agents if a._player == current_player), None)
-            
-            if current_agent:
-                # 回合开始
-                game_state = game.get_game_state()
-                current_agent.on_turn_start(game_state)
-                
-                # 获取有效动作
-                valid_actions = game.get_valid_actions()
+        # 游戏历史按JSONL格式逐条追加写入，不在内存中保留整局历史
+        os.makedirs("results", exist_ok=True)
+        history_path = os.path.join("results", f"game_{game_idx}.jsonl")
+        history_length = 0
+        loop = asyncio.get_running_loop()
+        
+        with open(history_path, "wb") as history_file:
+            # 运行游戏直到结束
+            while not game.game_over:
+                current_player = game.get_current_player()
+                current_agent = player_to_agent.get(current_player.player_id)
                 
-                if valid_actions:
-                    # 让代理选择动作
-                    selected_action = current_agent.select_action(game_state, valid_actions)
+                if current_agent:
+                    # 回合开始
+                    game_state = game.get_game_state()
+                    current_agent.on_turn_start(game_state)
                     
-                    # 执行动作
-                    success = game.execute_action(selected_action)
+                    # 获取有效动作
+                    valid_actions = game.get_valid_actions()
                     
-                    # 回合结束
-                    game_state = game.get_game_state()
-                    current_agent.on_turn_end(game_state, selected_action, success)
+                    if valid_actions:
+                        # 启用预取时，按预测的动作为下一位玩家提前发出请求，与当前决策同时进行
+                        speculation = None
+                        if self.speculative_prefetch:
+                            speculation = self._speculate(game, valid_actions, player_to_agent, semaphore)
+                        
+                        # 让代理选择动作
+                        async with semaphore:
+                            selected_action = await current_agent.select_action_async(game_state, valid_actions)
+                        
+                        # 预测失败时取消预取
+                        if speculation is not None:
+                            predicted_action, next_agent, prefetch_task = speculation
+                            if str(predicted_action) != str(selected_action):
+                                next_agent.cancel_prefetch(prefetch_task)
+                        
+                        # 执行动作
+                        success = game.execute_action(selected_action)
+                        
+                        # 将新产生的历史记录追加写入文件，写入放到线程池中执行，避免阻塞事件循环
+                        new_history = game.take_history()
+                        history_length += new_history.count(b"\n")
+                        await loop.run_in_executor(None, history_file.write, new_history)
+                        
+                        # 回合结束
+                        game_state = game.get_game_state()
+                        current_agent.on_turn_end(game_state, selected_action, success)
                 
-            # 进入下一个玩家
-            game.next_player()
+                # 进入下一个玩家
+                game.next_player()
         
         # 游戏结束
         game_state = game.get_game_state()
@@ -132,17 +318,47 @@ class Evaluator:
             "rounds": game.round_number,
             "winners": [{"player_id": player.player_id, "name": player.name, "score": player.get_score()} for player in game.winner] if game.winner else [],
             "players": [{"player_id": player.player_id, "name": player.name, "score": player.get_score(), "agent_type": type(agent).__name__} for player, agent in zip(players, shuffled_agents)],
-            "history_length": len(game.history)
+            "history_length": history_length
         }
         
-        # 保存游戏历史
-        history_file = os.path.join("results", f"game_{game_idx}_history.json")
-        os.makedirs("results", exist_ok=True)
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump(game.history, f, ensure_ascii=False, indent=2)
-        
         return game_results
     
+    def _speculate(self, game: Game, valid_actions: List[Action], player_to_agent: Dict[str, BaseAgent],
+                   semaphore: asyncio.Semaphore) -> Optional[Tuple[Action, BaseAgent, asyncio.Task]]:
+        """预测当前玩家的动作，在游戏副本上执行后为下一位玩家预取决策
+        
+        下一回合的真实提示与预取时完全相同才会使用预取结果，因此预测错误不影响游戏结果；
+        预取请求与真实决策共用信号量，进行中的请求总数不超过max_concurrency
+        
+        Returns:
+            Optional[Tuple[Action, BaseAgent, asyncio.Task]]: (预测的动作, 下一位玩家的代理, 预取任务)，
+            无法预测或代理不支持预取时返回None
+        """
+        # 能购买卡牌时通常会选择购买，只对这种情况进行预测
+        predicted_action = next((action for action in valid_actions
+                                 if action.action_type in (ActionType.BUY_CARD, ActionType.BUY_RESERVED_CARD)), None)
+        if predicted_action is None:
+            return None
+        
+        # 在游戏副本上执行预测的动作，副本带有独立的随机数生成器，不影响真实游戏
+        shadow = copy.deepcopy(game)
+        shadow.enable_history = False
+        success = shadow.execute_action(predicted_action)
+        shadow.next_player()
+        
+        if not success or shadow.game_over:
+            return None
+        
+        next_agent = player_to_agent.get(shadow.get_current_player().player_id)
+        next_actions = shadow.get_valid_actions()
+        if next_agent is None or not next_actions:
+            return None
+        
+        prefetch_task = next_agent.prefetch_action(shadow.get_game_state(), next_actions, semaphore)
+        if prefetch_task is None:
+            return None
+        return predicted_action, next_agent, prefetch_task
+    
     def _generate_summary(self):
         """生成评估汇总结果"""
         # 初始化汇总数据
@@ -154,56 +370,50 @@ class Evaluator:
             "average_rank": {}
         }
         
-        # 统计每个代理的表现
-        agent_wins = defaultdict(int)
-        agent_scores = defaultdict(list)
-        agent_ranks = defaultdict(list)
+        # 将所有游戏中每个玩家的结果展开为一维数组（每局内按排名顺序排列），再按代理类型分组归约
+        type_index = {type(agent).__name__: i for i, agent in enumerate(self.agents)}
+        type_ids, scores, ranks, wins = [], [], [], []
         
-        # 处理每个游戏的结果
         for game in self.results["games"]:
-            # 计算玩家排名
-            sorted_players = sorted(game["players"], key=lambda p: p["score"], reverse=True)
-            ranks = {}
+            players = game["players"]
+            winner_ids = {winner["player_id"] for winner in game["winners"]}
             
-            for rank, player in enumerate(sorted_players):
-                player_id = player["player_id"]
-                agent_type = player["agent_type"]
-                score = player["score"]
-                
-                # 记录排名
-                ranks[player_id] = rank + 1  # 排名从1开始
-                
-                # 记录分数
-                agent_scores[agent_type].append(score)
-                
-                # 记录排名
-                agent_ranks[agent_type].append(rank + 1)
+            # 计算玩家排名，稳定排序保证同分玩家保持原有顺序
+            order = np.argsort(-np.array([player["score"] for player in players]), kind="stable")
             
-            # 记录获胜情况
-            for winner in game["winners"]:
-                player_id = winner["player_id"]
-                for player in game["players"]:
-                    if player["player_id"] == player_id:
-                        agent_type = player["agent_type"]
-                        agent_wins[agent_type] += 1
-                        break
+            for rank, idx in enumerate(order.tolist()):
+                player = players[idx]
+                type_ids.append(type_index.get(player["agent_type"], -1))
+                scores.append(player["score"])
+                ranks.append(rank + 1)  # 排名从1开始
+                wins.append(player["player_id"] in winner_ids)
+        
+        type_ids = np.array(type_ids, dtype=np.int16)
+        scores = np.array(scores, dtype=np.int16)
+        ranks = np.array(ranks, dtype=np.int16)
+        wins = np.array(wins, dtype=bool)
         
         # 计算胜率
         for agent in self.agents:
             agent_type = type(agent).__name__
-            win_rate = agent_wins[agent_type] / self.num_games
-            avg_score = sum(agent_scores[agent_type]) / len(agent_scores[agent_type]) if agent_scores[agent_type] else 0
-            avg_rank = sum(agent_ranks[agent_type]) / len(agent_ranks[agent_type]) if agent_ranks[agent_type] else 0
+            mask = type_ids == type_index[agent_type]
+            agent_scores = scores[mask]
+            agent_ranks = ranks[mask]
+            agent_wins = int(wins[mask].sum())
+            
+            win_rate = agent_wins / self.num_games
+            avg_score = float(agent_scores.mean()) if agent_scores.size else 0
+            avg_rank = float(agent_ranks.mean()) if agent_ranks.size else 0
             
             summary["agent_performance"][agent_type] = {
                 "name": agent.name,
                 "player_id": agent.player_id,
-                "wins": agent_wins[agent_type],
+                "wins": agent_wins,
                 "win_rate": win_rate,
                 "average_score": avg_score,
                 "average_rank": avg_rank,
-                "scores": agent_scores[agent_type],
-                "ranks": agent_ranks[agent_type]
+                "scores": agent_scores.tolist(),
+                "ranks": agent_ranks.tolist()
             }
         
         # 按胜率排序
@@ -215,4 +425,16 @@ class Evaluator:
         # 按平均排名排序
         summary["average_rank"] = {agent_type: data["average_rank"] for agent_type, data in sorted(summary["agent_performance"].items(), key=lambda x: x[1]["average_rank"])}
         
-        self.results["summary"] = summary 
\ No newline at end of file
+        self.results["summary"] = summary 
+
+
+def _play_one_game(game_idx: int, seed: int, shuffled_agents: List[BaseAgent], num_games: int,
+                   speculative_prefetch: bool) -> Dict[str, Any]:
+    """在子进程中运行单个游戏，供进程池调用
+    
+    子进程不继承父进程的随机数状态，按本局的种子设置random的种子，使代理的随机选择只取决于游戏种子，
+    相同种子的评估结果与进程数量和游戏被分配到哪个进程无关
+    """
+    random.seed(seed)
+    evaluator = Evaluator(shuffled_agents, num_games=num_games, speculative_prefetch=speculative_prefetch, checkpoint_file=None)
+    return asyncio.run(evaluator._arun_game(game_idx, seed, shuffled_agents, asyncio.Semaphore(1)))
\ No newline at end of file
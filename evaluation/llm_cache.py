@@ -0,0 +1,57 @@
+import os
+import hashlib
+from typing import Optional
+
+try:
+    import diskcache
+except ImportError:  # diskcache为可选依赖，未安装时不启用持久化响应缓存
+    diskcache = None
+
+
+# 默认缓存目录
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.cache/splendor-llm-responses")
+
+
+class LLMResponseCache:
+    """持久化的LLM响应缓存
+    
+    基于diskcache（SQLite）将响应保存在磁盘上，使用相同种子重复评估时可以直接复用之前的响应。
+    超出容量上限时按最久未使用淘汰。
+    """
+    
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, size_limit: int = 2 ** 30):
+        """初始化缓存
+        
+        Args:
+            directory: 缓存目录
+            size_limit: 缓存占用磁盘空间的上限(字节)
+        """
+        if diskcache is None:
+            raise ImportError("使用持久化响应缓存需要安装diskcache")
+        
+        self._cache = diskcache.Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+    
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: int, system_prompt: str, user_prompt: str) -> str:
+        """根据模型、生成参数和提示计算缓存键"""
+        prompt_hash = hashlib.blake2b(f"{system_prompt}\0{user_prompt}".encode("utf-8")).hexdigest()
+        return f"{model}|{temperature}|{max_tokens}|{prompt_hash}"
+    
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存的响应，未命中时返回None"""
+        return self._cache.get(key)
+    
+    def set(self, key: str, response: str):
+        """保存响应"""
+        self._cache.set(key, response)
+    
+    def close(self):
+        """关闭缓存"""
+        self._cache.close()
+
+
+def open_response_cache(directory: str = DEFAULT_CACHE_DIR) -> Optional[LLMResponseCache]:
+    """打开持久化响应缓存，未安装diskcache时返回None"""
+    if diskcache is None:
+        return None
+    return LLMResponseCache(directory)
\ No newline at end of file
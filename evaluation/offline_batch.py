@@ -0,0 +1,210 @@
+import os
+import time
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from game.game import Action, Game
+from game.player import Player
+from game.serializers import to_json_bytes, from_json
+from agents.llm_agent import LLMAgent
+
+
+# 批量请求文件中每个请求调用的接口
+BATCH_ENDPOINT = "/v1/chat/completions"
+# 批处理任务的终止状态
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class OfflineBatchEvaluator:
+    """离线批量评估
+    
+    对局中每一步的提示都依赖之前的决策，无法提前整体提交，因此这里改为评估独立的局面：
+    用随机走子采样若干局面，把每个局面下的动作选择请求写入一个JSONL文件，通过OpenAI Batch API
+    一次性提交，完成后解析每个响应并统计动作解析成功率和动作类型分布。
+    批量接口不要求低延迟，服务端可以连续批处理，成本和吞吐都优于逐条实时请求。
+    
+    生成的请求文件与vLLM的离线批处理入口(vllm.entrypoints.openai.run_batch)格式相同，
+    自部署模型可以用它生成结果文件后再通过load_results读取。
+    """
+    
+    def __init__(self, agent: LLMAgent, num_positions: int = 100, seed: Optional[int] = None,
+                 num_players: int = 2, max_random_turns: int = 40):
+        """初始化离线批量评估
+        
+        Args:
+            agent: 用于构建提示和解析响应的LLM代理
+            num_positions: 采样的局面数量
+            seed: 随机种子，相同种子采样出相同的局面
+            num_players: 每个局面的玩家数量
+            max_random_turns: 采样局面前最多随机走的步数
+        """
+        self.agent = agent
+        self.num_positions = num_positions
+        self.seed = seed
+        self.num_players = num_players
+        self.max_random_turns = max_random_turns
+        self._positions: Optional[List[Tuple[int, int, Dict[str, Any], List[Action]]]] = None
+    
+    def sample_positions(self) -> List[Tuple[int, int, Dict[str, Any], List[Action]]]:
+        """采样局面
+        
+        每个局面由(游戏种子, 随机走的步数)确定，重新采样时可以完全复现
+        
+        Returns:
+            List[Tuple[int, int, Dict[str, Any], List[Action]]]: (游戏种子, 步数, 游戏状态, 有效动作)列表
+        """
+        if self._positions is not None:
+            return self._positions
+        
+        rng = random.Random(self.seed)
+        positions = []
+        while len(positions) < self.num_positions:
+            game_seed = rng.randint(0, 10 ** 9)
+            turns = rng.randint(0, self.max_random_turns)
+            players = [Player(f"player_{i+1}", f"玩家 {i+1}") for i in range(self.num_players)]
+            game = Game(players, seed=game_seed, enable_history=False)
+            
+            for _ in range(turns):
+                if game.game_over:
+                    break
+                game.play_round()
+            
+            valid_actions = game.get_valid_actions()
+            if game.game_over or not valid_actions:
+                continue
+            positions.append((game_seed, turns, game.get_game_state(), valid_actions))
+        
+        self._positions = positions
+        return positions
+    
+    def write_batch_file(self, path: str, model: str) -> int:
+        """将所有局面的动作选择请求写入Batch API格式的JSONL文件
+        
+        Args:
+            path: 输出文件路径
+            model: 请求使用的模型名称
+            
+        Returns:
+            int: 写入的请求数量
+        """
+        positions = self.sample_positions()
+        with open(path, "wb") as f:
+            for i, (_, _, game_state, valid_actions) in enumerate(positions):
+                system_prompt, user_prompt = self.agent.build_action_request(game_state, valid_actions)
+                request = {
+                    "custom_id": f"position-{i}",
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {
+                        "model": model,
+                        "messages": [
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        "temperature": self.agent.temperature,
+                        "max_tokens": self.agent.max_tokens
+                    }
+                }
+                f.write(to_json_bytes(request, indent=False) + b"\n")
+        return len(positions)
+    
+    def run(self, openai_client: Any, model: str, output_dir: str = "results", poll_interval: float = 30) -> Dict[str, Any]:
+        """提交批处理任务，等待完成后解析结果
+        
+        Args:
+            openai_client: openai.OpenAI客户端（或兼容Batch API的客户端）
+            model: 请求使用的模型名称
+            output_dir: 请求文件、结果文件和评估结果的输出目录
+            poll_interval: 查询任务状态的间隔(秒)
+            
+        Returns:
+            Dict[str, Any]: 评估结果
+            
+        Raises:
+            RuntimeError: 客户端不支持Batch API或批处理任务未成功完成
+        """
+        # Batch API需要openai>=1.18.0，较旧的SDK没有batches资源
+        if not hasattr(openai_client, "batches"):
+            raise RuntimeError("当前的openai SDK不支持Batch API，请升级到openai>=1.18.0（pip install -r requirements.txt）")
+        
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = int(time.time())
+        input_path = os.path.join(output_dir, f"offline_batch_{timestamp}_input.jsonl")
+        output_path = os.path.join(output_dir, f"offline_batch_{timestamp}_output.jsonl")
+        
+        num_requests = self.write_batch_file(input_path, model)
+        print(f"已写入 {num_requests} 个请求: {input_path}")
+        
+        with open(input_path, "rb") as f:
+            input_file = openai_client.files.create(file=f, purpose="batch")
+        batch = openai_client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                             completion_window="24h")
+        print(f"已提交批处理任务: {batch.id}")
+        
+        while batch.status not in BATCH_FINAL_STATUSES:
+            time.sleep(poll_interval)
+            batch = openai_client.batches.retrieve(batch.id)
+            print(f"批处理任务状态: {batch.status}")
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"批处理任务未成功完成: {batch.status}")
+        
+        with open(output_path, "wb") as f:
+            f.write(openai_client.files.content(batch.output_file_id).read())
+        
+        results = self.load_results(output_path)
+        results["batch_id"] = batch.id
+        
+        result_file = os.path.join(output_dir, f"offline_batch_{timestamp}.json")
+        with open(result_file, "wb") as f:
+            f.write(to_json_bytes(results))
+        
+        return results
+    
+    def load_results(self, output_path: str) -> Dict[str, Any]:
+        """读取Batch API（或vLLM run_batch）的结果文件，解析每个局面的响应并统计
+        
+        Args:
+            output_path: 结果文件路径
+            
+        Returns:
+            Dict[str, Any]: 评估结果
+        """
+        positions = self.sample_positions()
+        
+        responses: Dict[int, str] = {}
+        with open(output_path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = from_json(line)
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code", 200) != 200:
+                    continue
+                position_idx = int(record["custom_id"].rsplit("-", 1)[1])
+                responses[position_idx] = response["body"]["choices"][0]["message"]["content"]
+        
+        action_types = Counter()
+        decisions = []
+        for i, (game_seed, turns, _, valid_actions) in enumerate(positions):
+            response = responses.get(i)
+            action = self.agent.parse_action(response, valid_actions) if response is not None else None
+            if action is not None:
+                action_types[action.action_type.value] += 1
+            decisions.append({
+                "position": i,
+                "seed": game_seed,
+                "turns": turns,
+                "action": str(action) if action is not None else None
+            })
+        
+        num_parsed = sum(action_types.values())
+        return {
+            "num_positions": len(positions),
+            "num_responses": len(responses),
+            "num_parsed": num_parsed,
+            "parse_rate": num_parsed / len(positions) if positions else 0.0,
+            "action_types": dict(action_types),
+            "decisions": decisions
+        }
\ No newline at end of file
@@ -1,18 +1,25 @@
 import random
-from typing import Dict, List, Optional, Tuple
-from game.card import Card, GemColor, create_standard_cards
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from game.card import Card, GemColor, GEM_ORDER, COLOR_INDEX, GOLD, create_standard_cards
 from game.noble import Noble, create_standard_nobles
 
 
 class Board:
     """游戏板类，表示游戏的当前状态"""
     
-    def __init__(self, num_players: int = 2):
+    def __init__(self, num_players: int = 2, rng: Optional[random.Random] = None):
         """初始化游戏板
         
         Args:
             num_players: 玩家数量，默认为2
+            rng: 洗牌使用的随机数生成器，默认新建一个随机种子的生成器
         """
+        if rng is None:
+            rng = random.Random()
+        
         # 初始化宝石代币
         self.gems = self._initialize_gems(num_players)
         
@@ -28,7 +35,7 @@ class Board:
         
         # 洗牌
         for deck in self.card_decks.values():
-            random.shuffle(deck)
+            rng.shuffle(deck)
         
         # 初始化展示的卡牌
         self.displayed_cards = {
@@ -37,20 +44,47 @@ class Board:
             3: []
         }
         
+        # 展示区卡牌ID到卡牌的索引，与displayed_cards同步维护
+        self._card_index: Dict[str, Card] = {}
+        
+        # 展示区卡牌的扁平列表及其在标准卡牌表中的下标，展示区变化时重建
+        self._displayed_table: Optional[Tuple[List[Tuple[int, Card]], np.ndarray]] = None
+        
+        # 展示区版本号，展示区每次变化时递增，供外部按版本缓存依赖展示区的计算结果
+        self.displayed_version = 0
+        
+        # 普通颜色宝石的位掩码缓存：(宝石向量内容, 有剩余的颜色, 剩余不少于4个的颜色)
+        self._gem_masks: Optional[Tuple[bytes, int, int]] = None
+        
+        # to_dict的分段缓存：展示区卡牌和贵族变化时标记为脏，宝石按向量内容判断是否变化
+        self._state_cache: Dict[str, Any] = {}
+        self._state_dirty = {"cards", "nobles"}
+        self._gems_key: Optional[bytes] = None
+        
         # 每个等级展示4张卡
         for level in [1, 2, 3]:
             for _ in range(4):
                 if self.card_decks[level]:
-                    self.displayed_cards[level].append(self.card_decks[level].pop())
+                    self._display_card(level, self.card_decks[level].pop())
         
         # 初始化贵族
         all_nobles = create_standard_nobles()
-        random.shuffle(all_nobles)
+        rng.shuffle(all_nobles)
         self.nobles = all_nobles[:num_players + 1]  # 贵族数量 = 玩家数量 + 1
+        self._noble_index: Dict[str, Noble] = {noble.noble_id: noble for noble in self.nobles}
+
     
-    def _initialize_gems(self, num_players: int) -> Dict[GemColor, int]:
-        """根据玩家数量初始化宝石代币"""
-        gems = {}
+    def _reindex(self):
+        """displayed_cards或nobles被整体替换（如恢复快照）后重建索引，并使依赖它们的缓存失效"""
+        self._card_index = {card.card_id: card for cards in self.displayed_cards.values() for card in cards}
+        self._noble_index = {noble.noble_id: noble for noble in self.nobles}
+        self._displayed_table = None
+        self.displayed_version += 1
+        self._state_dirty = {"cards", "nobles"}
+    
+    def _initialize_gems(self, num_players: int) -> np.ndarray:
+        """根据玩家数量初始化宝石代币，返回按GEM_ORDER索引的数量向量"""
+        gems = np.zeros(len(GEM_ORDER), dtype=np.int8)
         
         # 2人游戏：每种颜色4个代币
         # 3人游戏：每种颜色5个代币
@@ -62,10 +96,10 @@ class Board:
         }
         
         for color in [GemColor.WHITE, GemColor.BLUE, GemColor.GREEN, GemColor.RED, GemColor.BLACK]:
-            gems[color] = base_gems.get(num_players, 4)
+            gems[COLOR_INDEX[color]] = base_gems.get(num_players, 4)
         
         # 黄金宝石数量固定为5个
-        gems[GemColor.GOLD] = 5
+        gems[COLOR_INDEX[GemColor.GOLD]] = 5
         
         return gems
     
@@ -75,49 +109,88 @@ class Board:
             return None
         return self.card_decks[level].pop()
     
+    def _display_card(self, level: int, card: Card):
+        """将卡牌放入展示区"""
+        self.displayed_cards[level].append(card)
+        self._card_index[card.card_id] = card
+        self._displayed_table = None
+        self.displayed_version += 1
+        self._state_dirty.add("cards")
+    
     def replenish_displayed_cards(self):
         """补充展示区的卡牌"""
         for level in [1, 2, 3]:
             while len(self.displayed_cards[level]) < 4 and self.card_decks[level]:
-                self.displayed_cards[level].append(self.draw_card(level))
+                self._display_card(level, self.draw_card(level))
     
     def remove_displayed_card(self, level: int, card_id: str) -> Optional[Card]:
         """从展示区移除指定卡牌"""
-        for i, card in enumerate(self.displayed_cards[level]):
-            if card.card_id == card_id:
-                card = self.displayed_cards[level].pop(i)
-                self.replenish_displayed_cards()
-                return card
-        return None
-    
-    def take_gems(self, gems_to_take: Dict[GemColor, int]) -> bool:
+        card = self._card_index.get(card_id)
+        if card is None or card.level != level:
+            return None
+        
+        del self._card_index[card_id]
+        self.displayed_cards[level].remove(card)
+        self._displayed_table = None
+        self.displayed_version += 1
+        self._state_dirty.add("cards")
+        self.replenish_displayed_cards()
+        return card
+    
+    def get_gem_count(self, color: GemColor) -> int:
+        """获取游戏板上特定颜色的宝石数量"""
+        return int(self.gems[COLOR_INDEX[color]])
+    
+    def take_gems(self, gems_to_take: np.ndarray) -> bool:
         """尝试从游戏板拿取宝石代币
         
         Args:
-            gems_to_take: 要拿取的宝石颜色和数量
+            gems_to_take: 要拿取的宝石数量向量（按GEM_ORDER索引）
             
         Returns:
             bool: 是否成功拿取
         """
         # 检查是否有足够的宝石
-        for color, count in gems_to_take.items():
-            if self.gems.get(color, 0) < count:
-                return False
+        if np.any(self.gems < gems_to_take):
+            return False
         
         # 拿取宝石
-        for color, count in gems_to_take.items():
-            self.gems[color] -= count
+        self.gems -= gems_to_take
         
         return True
     
-    def return_gems(self, gems_to_return: Dict[GemColor, int]):
+    def return_gems(self, gems_to_return: np.ndarray):
         """将宝石代币归还到游戏板
         
         Args:
-            gems_to_return: 要归还的宝石颜色和数量
+            gems_to_return: 要归还的宝石数量向量（按GEM_ORDER索引）
         """
-        for color, count in gems_to_return.items():
-            self.gems[color] = self.gems.get(color, 0) + count
+        self.gems += gems_to_return
+    
+    def get_gem_masks(self) -> Tuple[int, int]:
+        """获取普通颜色宝石的位掩码
+        
+        Returns:
+            Tuple[int, int]: (有剩余的颜色, 剩余不少于4个的颜色)，第i位对应GEM_ORDER中的第i种颜色
+        """
+        gems_key = self.gems.tobytes()
+        if self._gem_masks is None or self._gem_masks[0] != gems_key:
+            available = 0
+            plentiful = 0
+            for i, count in enumerate(self.gems[:GOLD].tolist()):
+                if count > 0:
+                    available |= 1 << i
+                if count >= 4:
+                    plentiful |= 1 << i
+            self._gem_masks = (gems_key, available, plentiful)
+        return self._gem_masks[1], self._gem_masks[2]
+    
+    def get_displayed_table(self) -> Tuple[List[Tuple[int, Card]], np.ndarray]:
+        """获取展示区的(等级, 卡牌)列表及对应的卡牌下标(Card.idx)数组，顺序与displayed_cards一致"""
+        if self._displayed_table is None:
+            entries = [(level, card) for level, cards in self.displayed_cards.items() for card in cards]
+            self._displayed_table = (entries, np.array([card.idx for _, card in entries], dtype=np.intp))
+        return self._displayed_table
     
     def get_card_by_id(self, card_id: str) -> Optional[Tuple[int, Card]]:
         """根据卡牌ID查找卡牌
@@ -125,50 +198,47 @@ class Board:
         Returns:
             Tuple[int, Card]: (卡牌等级, 卡牌对象)
         """
-        for level, cards in self.displayed_cards.items():
-            for card in cards:
-                if card.card_id == card_id:
-                    return level, card
-        return None
+        card = self._card_index.get(card_id)
+        if card is None:
+            return None
+        return card.level, card
     
     def get_noble_by_id(self, noble_id: str) -> Optional[Noble]:
         """根据贵族ID查找贵族"""
-        for noble in self.nobles:
-            if noble.noble_id == noble_id:
-                return noble
-        return None
+        return self._noble_index.get(noble_id)
     
     def remove_noble(self, noble_id: str) -> Optional[Noble]:
         """从游戏板移除指定贵族"""
-        for i, noble in enumerate(self.nobles):
-            if noble.noble_id == noble_id:
-                return self.nobles.pop(i)
-        return None
+        noble = self._noble_index.pop(noble_id, None)
+        if noble is not None:
+            self.nobles.remove(noble)
+            self._state_dirty.add("nobles")
+        return noble
     
     def to_dict(self) -> dict:
-        """将游戏板状态转换为字典，用于AI代理理解"""
-        return {
-            "gems": {color.value: count for color, count in self.gems.items()},
-            "displayed_cards": {
-                level: [
-                    {
-                        "id": card.card_id,
-                        "level": card.level,
-                        "points": card.points,
-                        "color": card.gem_color.value,
-                        "cost": {color.value: count for color, count in card.cost.items()}
-                    } 
-                    for card in cards
-                ]
+        """将游戏板状态转换为字典，用于AI代理理解
+        
+        只重建自上次调用后发生变化的部分，未变化的部分复用上次的结果
+        """
+        gems_key = self.gems.tobytes()
+        if gems_key != self._gems_key:
+            self._gems_key = gems_key
+            self._state_cache["gems"] = {color.value: count for color, count in zip(GEM_ORDER, self.gems.tolist())}
+        
+        if "cards" in self._state_dirty:
+            self._state_cache["displayed_cards"] = {
+                level: [card.to_dict() for card in cards]
                 for level, cards in self.displayed_cards.items()
-            },
+            }
+        
+        if "nobles" in self._state_dirty:
+            self._state_cache["nobles"] = [noble.to_dict() for noble in self.nobles]
+        
+        self._state_dirty.clear()
+        
+        return {
+            "gems": self._state_cache["gems"],
+            "displayed_cards": self._state_cache["displayed_cards"],
             "deck_counts": {level: len(deck) for level, deck in self.card_decks.items()},
-            "nobles": [
-                {
-                    "id": noble.noble_id,
-                    "points": noble.points,
-                    "requirements": {color.value: count for color, count in noble.requirements.items()}
-                }
-                for noble in self.nobles
-            ]
-        } 
\ No newline at end of file
+            "nobles": self._state_cache["nobles"]
+        }
\ No newline at end of file
@@ -1,6 +1,8 @@
 from enum import Enum
-from dataclasses import dataclass
-from typing import Dict
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Tuple
+
+import numpy as np
 
 
 class GemColor(Enum):
@@ -13,14 +15,66 @@ class GemColor(Enum):
     GOLD = "gold"  # 黄金宝石作为通配符
 
 
-@dataclass
+# 宝石向量中各颜色的固定顺序，宝石数量以按此顺序索引的定长数组保存
+GEM_ORDER = (GemColor.WHITE, GemColor.BLUE, GemColor.GREEN, GemColor.RED, GemColor.BLACK, GemColor.GOLD)
+COLOR_INDEX = {color: i for i, color in enumerate(GEM_ORDER)}
+
+# 各颜色在宝石数组中的整数下标，热点路径直接用下标访问定长数组，只在序列化时转换回颜色名
+WHITE, BLUE, GREEN, RED, BLACK, GOLD = range(len(GEM_ORDER))
+COLOR_NAMES = tuple(color.value for color in GEM_ORDER)
+
+# 打包宝石向量时每种颜色占用的位数，每种颜色的数量都小于64
+GEM_BITS = 6
+
+
+def pack_gems(vec) -> int:
+    """将按GEM_ORDER排列的前5种普通颜色数量打包成一个整数，第i种颜色占第6i到6i+5位"""
+    packed = 0
+    for i in range(GOLD):
+        packed |= vec[i] << (GEM_BITS * i)
+    return packed
+
+
+@dataclass(slots=True, frozen=True)
 class Card:
-    """发展卡类"""
+    """发展卡类（不可变，可在多局游戏和状态副本之间共享）"""
     level: int  # 卡牌等级：1, 2, 3
     points: int  # 胜利点数
     gem_color: GemColor  # 卡牌提供的宝石颜色
     cost: Dict[GemColor, int]  # 购买卡牌所需的宝石成本
     card_id: str  # 卡牌唯一标识符
+    idx: int = field(default=-1, compare=False, repr=False)  # 卡牌在标准卡牌表(CARD_COST等)中的下标，非标准卡牌为-1
+
+    # 以下字段由__post_init__根据cost等字段派生
+    cost_vec: Tuple[int, ...] = field(init=False, compare=False, repr=False)  # 按GEM_ORDER排列的成本
+    cost_arr: np.ndarray = field(init=False, compare=False, repr=False)  # cost_vec的numpy数组形式
+    cost_packed: int = field(init=False, compare=False, repr=False)  # 按pack_gems打包的普通颜色成本
+    color_idx: int = field(init=False, compare=False, repr=False)  # 提供的宝石颜色下标
+    _as_dict: dict = field(init=False, compare=False, repr=False)  # to_dict的缓存结果
+
+    def __post_init__(self):
+        cost_vec = tuple(self.cost.get(color, 0) for color in GEM_ORDER)
+        object.__setattr__(self, "cost_vec", cost_vec)
+        object.__setattr__(self, "cost_arr", np.array(cost_vec, dtype=np.int8))
+        object.__setattr__(self, "cost_packed", pack_gems(cost_vec))
+        object.__setattr__(self, "color_idx", COLOR_INDEX[self.gem_color])
+
+        # 卡牌属性在游戏中不会改变，序列化结果只需计算一次
+        object.__setattr__(self, "_as_dict", {
+            "id": self.card_id,
+            "level": self.level,
+            "points": self.points,
+            "color": self.gem_color.value,
+            "cost": {color.value: count for color, count in self.cost.items()}
+        })
+
+    def __deepcopy__(self, memo):
+        # 卡牌不可变，复制游戏状态时直接共享同一对象
+        return self
+
+    def to_dict(self) -> dict:
+        """将卡牌转换为字典，用于AI代理理解（返回共享的缓存对象，调用方不应修改）"""
+        return self._as_dict
 
     def __str__(self):
         cost_str = ", ".join([f"{color.value}: {count}" for color, count in self.cost.items() if count > 0])
@@ -29,7 +83,7 @@ class Card:
 
 
 # 预定义的卡牌数据
-def create_standard_cards() -> list[Card]:
+def _build_standard_cards() -> list[Card]:
     """创建标准游戏中的所有发展卡"""
     cards = []
     
@@ -120,4 +174,27 @@ def create_standard_cards() -> list[Card]:
     ]
     cards.extend(level3_cards)
     
-    return cards 
\ No newline at end of file
+    # 记录每张卡牌在标准卡牌表中的下标
+    return [replace(card, idx=idx) for idx, card in enumerate(cards)]
+
+
+def _build_card_tables(cards: List[Card]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """将卡牌属性按列整理为数组（结构数组），供批量计算使用"""
+    cost = np.array([card.cost_vec[:GOLD] for card in cards], dtype=np.int8)
+    points = np.array([card.points for card in cards], dtype=np.int8)
+    color = np.array([card.color_idx for card in cards], dtype=np.int8)
+    level = np.array([card.level for card in cards], dtype=np.int8)
+    return cost, points, color, level
+
+
+# 标准卡牌只在导入时创建一次，各局游戏共享同一组不可变的卡牌对象，按Card.idx索引
+STANDARD_CARDS = tuple(_build_standard_cards())
+
+
+def create_standard_cards() -> list[Card]:
+    """获取标准游戏中的所有发展卡（返回新列表，其中的卡牌对象是共享的）"""
+    return list(STANDARD_CARDS)
+
+
+# 标准卡牌的成本、点数、颜色下标和等级，按Card.idx索引
+CARD_COST, CARD_POINTS, CARD_COLOR, CARD_LEVEL = _build_card_tables(STANDARD_CARDS)
\ No newline at end of file
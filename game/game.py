@@ -1,12 +1,17 @@
+import io
 import random
-import json
 import time
 from enum import Enum
-from typing import List, Dict, Optional, Union
+from itertools import combinations
+from typing import List, Dict, Optional, Tuple, Union
+
+import numpy as np
+
 from game.player import Player
 from game.board import Board
-from game.card import Card, GemColor
-from game.noble import Noble
+from game.card import Card, GemColor, GEM_ORDER, COLOR_INDEX, GOLD, STANDARD_CARDS, CARD_LEVEL
+from game.noble import Noble, STANDARD_NOBLES
+from game.serializers import to_json_bytes
 
 
 class ActionType(Enum):
@@ -30,8 +35,18 @@ class Action:
         """
         self.action_type = action_type
         self.params = kwargs
+        
+        # 动作创建后不再改变，描述和字典在首次使用时生成并缓存
+        self._str: Optional[str] = None
+        self._dict: Optional[dict] = None
     
     def __str__(self):
+        if self._str is None:
+            self._str = self._describe()
+        return self._str
+    
+    def _describe(self) -> str:
+        """生成动作的文字描述"""
         if self.action_type == ActionType.TAKE_DIFFERENT_GEMS:
             colors = [f"{color.value}" for color in self.params.get("colors", [])]
             return f"拿取不同颜色的宝石: {', '.join(colors)}"
@@ -56,7 +71,13 @@ class Action:
         return f"未知动作: {self.action_type}"
         
     def to_dict(self):
-        """将动作转换为字典，用于JSON序列化"""
+        """将动作转换为字典，用于JSON序列化（返回共享的缓存对象，调用方不应修改）"""
+        if self._dict is None:
+            self._dict = self._build_dict()
+        return self._dict
+    
+    def _build_dict(self) -> dict:
+        """生成动作的字典表示"""
         # 处理参数中的枚举类型
         processed_params = {}
         for k, v in self.params.items():
@@ -74,28 +95,165 @@ class Action:
         }
 
 
+def _build_different_gems_table() -> List[Tuple[Action, ...]]:
+    """预先生成每种可用颜色组合（5种普通颜色的位掩码）下所有拿取不同颜色宝石的动作"""
+    table = []
+    for mask in range(1 << GOLD):
+        available_colors = [GEM_ORDER[i] for i in range(GOLD) if mask & (1 << i)]
+        if len(available_colors) <= 3:
+            # 可用颜色不超过3种时只有一个动作：拿取所有可用颜色
+            combos = [available_colors]
+        else:
+            combos = [list(combo) for combo in combinations(available_colors, 3)]
+        table.append(tuple(Action(ActionType.TAKE_DIFFERENT_GEMS, colors=colors) for colors in combos))
+    return table
+
+
+# 拿取宝石的动作只由颜色决定，预先创建后在各回合间共享（共享的动作对象不应被修改）
+# 按可用颜色位掩码索引的拿取不同颜色宝石动作表
+TAKE_DIFFERENT_GEMS_ACTIONS = _build_different_gems_table()
+# 按颜色下标索引的拿取相同颜色宝石动作
+TAKE_SAME_GEMS_ACTIONS = tuple(Action(ActionType.TAKE_SAME_GEMS, color=GEM_ORDER[i]) for i in range(GOLD))
+# 按剩余不少于4个的颜色位掩码索引的拿取相同颜色宝石动作表
+TAKE_SAME_GEMS_TABLE = [
+    tuple(TAKE_SAME_GEMS_ACTIONS[i] for i in range(GOLD) if mask & (1 << i))
+    for mask in range(1 << GOLD)
+]
+
+# 快照中每个等级展示区和牌堆占用的槽位数
+SNAPSHOT_DISPLAY_SLOTS = 4
+SNAPSHOT_DECK_SLOTS = {level: int(np.count_nonzero(CARD_LEVEL == level)) for level in (1, 2, 3)}
+
+
+def _padded(values: List[int], size: int) -> List[int]:
+    """用-1将列表补齐到指定长度"""
+    return values + [-1] * (size - len(values))
+
+
 class Game:
     """璀璨宝石游戏类"""
     
-    def __init__(self, players: List[Player], seed: Optional[int] = None):
+    def __init__(self, players: List[Player], seed: Optional[int] = None, enable_history: bool = True):
         """初始化游戏
         
         Args:
             players: 玩家列表
             seed: 随机数种子，用于复现游戏
+            enable_history: 是否记录历史，只需要模拟结果时可以关闭以省去每步的序列化
         """
-        if seed is not None:
-            random.seed(seed)
+        # 游戏自己的随机数生成器，不修改random模块的全局状态，多局游戏并行时互不影响
+        self.rng = random.Random(seed)
         
         self.players = players
         self.num_players = len(players)
-        self.board = Board(self.num_players)
+        self.board = Board(self.num_players, self.rng)
         self.current_player_index = 0
         self.round_number = 1
         self.game_over = False
         self.winner = None
         self.last_round = False
-        self.history = []  # 游戏历史记录
+        # 触发最后一轮的玩家下标，-1表示尚未触发
+        self.last_player_index = -1
+        # 游戏历史记录，每个动作序列化为一行JSON(JSONL)追加到缓冲区
+        self.enable_history = enable_history
+        self.history_buf = io.BytesIO()
+        
+        # 各玩家购买展示区卡牌的动作缓存：玩家ID -> ((展示区版本, 宝石向量内容, 卡牌数量), 动作列表)
+        # 展示区、玩家宝石和折扣都未变化时直接复用上次的结果
+        self._buy_actions_cache: Dict[str, Tuple[Tuple[int, bytes, int], List[Action]]] = {}
+    
+    def snapshot(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """将游戏状态保存为一个扁平的int16数组，供搜索/模拟时快速保存和恢复（见restore）
+        
+        卡牌和贵族以其在标准表中的下标(Card.idx / Noble.idx)保存，空槽位为-1；不包含历史记录。
+        依次为：当前玩家、回合数、是否结束、是否最后一轮、触发最后一轮的玩家(-1表示未触发)、胜者位掩码(-1表示无)，游戏板宝石，
+        各等级展示区，各等级牌堆（按抽牌顺序），游戏板贵族，以及每位玩家的宝石、预留卡、贵族和卡牌
+        
+        Args:
+            out: 可选的预分配数组，长度须为snapshot_size()，传入时结果写入其中
+            
+        Returns:
+            np.ndarray: 快照数组
+        """
+        board = self.board
+        noble_slots = self.num_players + 1
+        
+        if self.winner is None:
+            winner_mask = -1
+        else:
+            winner_mask = sum(1 << i for i, player in enumerate(self.players) if player in self.winner)
+        data = [self.current_player_index, self.round_number, int(self.game_over), int(self.last_round),
+                self.last_player_index, winner_mask]
+        
+        data += board.gems.tolist()
+        for level, cards in board.displayed_cards.items():
+            data += _padded([card.idx for card in cards], SNAPSHOT_DISPLAY_SLOTS)
+        for level, deck in board.card_decks.items():
+            data += _padded([card.idx for card in deck], SNAPSHOT_DECK_SLOTS[level])
+        data += _padded([noble.idx for noble in board.nobles], noble_slots)
+        
+        for player in self.players:
+            data += player.gems.tolist()
+            data += _padded([card.idx for card in player.reserved_cards], 3)
+            data += _padded([noble.idx for noble in player.nobles], noble_slots)
+            data += _padded([card.idx for card in player.cards], len(STANDARD_CARDS))
+        
+        if out is None:
+            return np.array(data, dtype=np.int16)
+        out[:] = data
+        return out
+    
+    def snapshot_size(self) -> int:
+        """snapshot()返回的数组长度"""
+        noble_slots = self.num_players + 1
+        board_size = len(GEM_ORDER) + 3 * SNAPSHOT_DISPLAY_SLOTS + sum(SNAPSHOT_DECK_SLOTS.values()) + noble_slots
+        player_size = len(GEM_ORDER) + 3 + noble_slots + len(STANDARD_CARDS)
+        return 6 + board_size + self.num_players * player_size
+    
+    def restore(self, snapshot: np.ndarray):
+        """将游戏恢复到snapshot()保存的状态（玩家对象和历史记录保持不变）"""
+        values = snapshot.tolist()
+        board = self.board
+        noble_slots = self.num_players + 1
+        
+        def take(size: int) -> List[int]:
+            nonlocal pos
+            segment = values[pos:pos + size]
+            pos += size
+            return segment
+        
+        def cards(size: int) -> List[Card]:
+            return [STANDARD_CARDS[i] for i in take(size) if i >= 0]
+        
+        def nobles(size: int) -> List[Noble]:
+            return [STANDARD_NOBLES[i] for i in take(size) if i >= 0]
+        
+        pos = 0
+        self.current_player_index, self.round_number, game_over, last_round, self.last_player_index, winner_mask = take(6)
+        self.game_over = bool(game_over)
+        self.last_round = bool(last_round)
+        if winner_mask < 0:
+            self.winner = None
+        else:
+            self.winner = [player for i, player in enumerate(self.players) if winner_mask & (1 << i)]
+        
+        board.gems[:] = take(len(GEM_ORDER))
+        for level in board.displayed_cards:
+            board.displayed_cards[level] = cards(SNAPSHOT_DISPLAY_SLOTS)
+        for level in board.card_decks:
+            board.card_decks[level] = cards(SNAPSHOT_DECK_SLOTS[level])
+        board.nobles = nobles(noble_slots)
+        board._reindex()
+        
+        for player in self.players:
+            player.gems[:] = take(len(GEM_ORDER))
+            player.reserved_cards = cards(3)
+            player.nobles = nobles(noble_slots)
+            player.cards = cards(len(STANDARD_CARDS))
+            player._reindex()
+        
+        # 玩家卡牌可能被整体替换，缓存键中的卡牌数量不再可靠
+        self._buy_actions_cache.clear()
     
     def get_current_player(self) -> Player:
         """获取当前行动的玩家"""
@@ -134,36 +292,69 @@ class Game:
         
         return actions
     
-    def _get_different_gems_actions(self) -> List[Action]:
-        """获取拿取不同颜色宝石的所有可能动作"""
-        actions = []
-        available_colors = []
+    def sample_random_action(self, rng: Optional[random.Random] = None) -> Optional[Action]:
+        """从当前玩家的有效动作中均匀随机选择一个，结果与rng.choice(get_valid_actions())相同
         
-        for color in [GemColor.WHITE, GemColor.BLUE, GemColor.GREEN, GemColor.RED, GemColor.BLACK]:
-            if self.board.gems.get(color, 0) > 0:
-                available_colors.append(color)
+        先只统计各类动作的数量，按数量加权选出动作类别后再只构造被选中的那一个动作，
+        适用于只需要随机走子的模拟，需要完整动作列表时使用get_valid_actions
         
-        # 如果可用颜色少于3种，则返回所有可能的组合
-        if len(available_colors) <= 3:
-            actions.append(Action(ActionType.TAKE_DIFFERENT_GEMS, colors=available_colors))
-            return actions
+        Args:
+            rng: 随机数生成器，默认使用游戏自己的生成器self.rng
+            
+        Returns:
+            Optional[Action]: 选中的动作，没有有效动作时返回None
+        """
+        if rng is None:
+            rng = self.rng
+        player = self.get_current_player()
         
-        # 否则返回所有3种颜色的组合
-        from itertools import combinations
-        for combo in combinations(available_colors, 3):
-            actions.append(Action(ActionType.TAKE_DIFFERENT_GEMS, colors=list(combo)))
+        # 各类别的顺序与get_valid_actions保持一致
+        available, plentiful = self.board.get_gem_masks()
+        different_gems = TAKE_DIFFERENT_GEMS_ACTIONS[available]
+        same_gems = TAKE_SAME_GEMS_TABLE[plentiful]
         
-        return actions
+        entries, _ = self.board.get_displayed_table()
+        decks = [level for level, deck in self.board.card_decks.items() if deck]
+        can_reserve = len(player.reserved_cards) < 3
+        reserve_count = len(entries) + len(decks) if can_reserve else 0
+        
+        buy_card = self._get_buy_card_actions(player)
+        buy_reserved = self._get_buy_reserved_card_actions(player)
+        
+        total = len(different_gems) + len(same_gems) + reserve_count + len(buy_card) + len(buy_reserved)
+        if total == 0:
+            return None
+        
+        k = rng.randrange(total)
+        if k < len(different_gems):
+            return different_gems[k]
+        k -= len(different_gems)
+        
+        if k < len(same_gems):
+            return same_gems[k]
+        k -= len(same_gems)
+        
+        if k < reserve_count:
+            if k < len(entries):
+                level, card = entries[k]
+                return Action(ActionType.RESERVE_CARD, level=level, card_id=card.card_id)
+            return Action(ActionType.RESERVE_CARD, level=decks[k - len(entries)], from_deck=True)
+        k -= reserve_count
+        
+        if k < len(buy_card):
+            return buy_card[k]
+        return buy_reserved[k - len(buy_card)]
+    
+    def _get_different_gems_actions(self) -> List[Action]:
+        """获取拿取不同颜色宝石的所有可能动作"""
+        # 按游戏板上有剩余的普通颜色的位掩码直接查表得到所有组合
+        available, _ = self.board.get_gem_masks()
+        return list(TAKE_DIFFERENT_GEMS_ACTIONS[available])
     
     def _get_same_gems_actions(self) -> List[Action]:
         """获取拿取相同颜色宝石的所有可能动作"""
-        actions = []
-        
-        for color in [GemColor.WHITE, GemColor.BLUE, GemColor.GREEN, GemColor.RED, GemColor.BLACK]:
-            if self.board.gems.get(color, 0) >= 4:
-                actions.append(Action(ActionType.TAKE_SAME_GEMS, color=color))
-        
-        return actions
+        _, plentiful = self.board.get_gem_masks()
+        return list(TAKE_SAME_GEMS_TABLE[plentiful])
     
     def _get_reserve_card_actions(self, player: Player) -> List[Action]:
         """获取预留卡牌的所有可能动作"""
@@ -187,21 +378,35 @@ class Game:
     
     def _get_buy_card_actions(self, player: Player) -> List[Action]:
         """获取购买展示区卡牌的所有可能动作"""
+        key = (self.board.displayed_version, player.gems.tobytes(), len(player.cards))
+        cached = self._buy_actions_cache.get(player.player_id)
+        if cached is not None and cached[0] == key:
+            return list(cached[1])
+        
         actions = []
         
-        for level, cards in self.board.displayed_cards.items():
-            for card in cards:
-                if player.can_afford_card(card):
+        # 一次性判断展示区所有卡牌能否购买
+        entries, card_idx = self.board.get_displayed_table()
+        if entries:
+            affordable = player.get_affordable_mask(card_idx)
+            for (level, card), can_afford in zip(entries, affordable.tolist()):
+                if can_afford:
                     actions.append(Action(ActionType.BUY_CARD, level=level, card_id=card.card_id))
         
-        return actions
+        self._buy_actions_cache[player.player_id] = (key, actions)
+        return list(actions)
     
     def _get_buy_reserved_card_actions(self, player: Player) -> List[Action]:
         """获取购买预留卡牌的所有可能动作"""
         actions = []
         
-        for card in player.reserved_cards:
-            if player.can_afford_card(card):
+        if not player.reserved_cards:
+            return actions
+        
+        card_idx = np.array([card.idx for card in player.reserved_cards], dtype=np.intp)
+        affordable = player.get_affordable_mask(card_idx)
+        for card, can_afford in zip(player.reserved_cards, affordable.tolist()):
+            if can_afford:
                 actions.append(Action(ActionType.BUY_RESERVED_CARD, card_id=card.card_id))
         
         return actions
@@ -218,12 +423,13 @@ class Game:
         player = self.get_current_player()
         
         # 记录动作到历史记录
-        self.history.append({
-            "round": self.round_number,
-            "player": player.player_id,
-            "action": str(action),
-            "action_data": action.to_dict()
-        })
+        if self.enable_history:
+            self.history_buf.write(to_json_bytes({
+                "round": self.round_number,
+                "player": player.player_id,
+                "action": str(action),
+                "action_data": action.to_dict()
+            }, indent=False) + b"\n")
         
         if action.action_type == ActionType.TAKE_DIFFERENT_GEMS:
             return self._execute_take_different_gems(player, action)
@@ -251,19 +457,18 @@ class Game:
             return False
         
         # 检查所有颜色是否都可用
-        gems_to_take = {}
+        gems_to_take = np.zeros(len(GEM_ORDER), dtype=np.int8)
         for color in colors:
-            if self.board.gems.get(color, 0) <= 0:
+            if self.board.get_gem_count(color) <= 0:
                 return False
-            gems_to_take[color] = 1
+            gems_to_take[COLOR_INDEX[color]] = 1
         
         # 执行拿取宝石
         if not self.board.take_gems(gems_to_take):
             return False
         
         # 更新玩家宝石
-        for color, count in gems_to_take.items():
-            player.gems[color] = player.gems.get(color, 0) + count
+        player.gems += gems_to_take
         
         # 检查是否需要丢弃宝石
         self._check_and_discard_gems(player)
@@ -274,16 +479,17 @@ class Game:
         """执行拿取相同颜色宝石的动作"""
         color = action.params.get("color")
         
-        if not color or self.board.gems.get(color, 0) < 4:
+        if not color or self.board.get_gem_count(color) < 4:
             return False
         
         # 执行拿取宝石
-        gems_to_take = {color: 2}
+        gems_to_take = np.zeros(len(GEM_ORDER), dtype=np.int8)
+        gems_to_take[COLOR_INDEX[color]] = 2
         if not self.board.take_gems(gems_to_take):
             return False
         
         # 更新玩家宝石
-        player.gems[color] = player.gems.get(color, 0) + 2
+        player.gems[COLOR_INDEX[color]] += 2
         
         # 检查是否需要丢弃宝石
         self._check_and_discard_gems(player)
@@ -308,24 +514,21 @@ class Game:
                 card = self.board.card_decks[level].pop()
         else:
             # 从展示区预留
-            for i, c in enumerate(self.board.displayed_cards.get(level, [])):
-                if c.card_id == card_id:
-                    card = self.board.displayed_cards[level].pop(i)
-                    break
+            card = self.board.remove_displayed_card(level, card_id)
         
         if card is None:
             return False
         
         # 添加到玩家的预留卡
-        player.reserved_cards.append(card)
+        player.reserve_card(card)
         
         # 补充展示区的卡牌
         self.board.replenish_displayed_cards()
         
         # 如果有黄金宝石可用，玩家获得一个黄金宝石
-        if self.board.gems.get(GemColor.GOLD, 0) > 0:
-            self.board.gems[GemColor.GOLD] -= 1
-            player.gems[GemColor.GOLD] = player.gems.get(GemColor.GOLD, 0) + 1
+        if self.board.get_gem_count(GemColor.GOLD) > 0:
+            self.board.gems[GOLD] -= 1
+            player.gems[GOLD] += 1
             
             # 检查是否需要丢弃宝石
             self._check_and_discard_gems(player)
@@ -338,28 +541,26 @@ class Game:
         card_id = action.params.get("card_id")
         
         # 查找卡牌
-        card = None
-        for i, c in enumerate(self.board.displayed_cards.get(level, [])):
-            if c.card_id == card_id:
-                card = c
-                break
+        found = self.board.get_card_by_id(card_id)
+        if found is None or found[0] != level:
+            return False
+        card = found[1]
         
-        if card is None or not player.can_afford_card(card):
+        if not player.can_afford_card(card):
             return False
         
         # 计算实际支付成本
         actual_cost = player.get_actual_cost(card)
         
         # 支付宝石
-        for color, count in actual_cost.items():
-            player.gems[color] -= count
-            self.board.gems[color] = self.board.gems.get(color, 0) + count
+        player.gems -= actual_cost
+        self.board.return_gems(actual_cost)
         
         # 从展示区移除卡牌
         self.board.remove_displayed_card(level, card_id)
         
         # 将卡牌添加到玩家的卡牌列表
-        player.cards.append(card)
+        player.add_card(card)
         
         # 检查是否有贵族访问
         self._check_nobles_visit(player)
@@ -374,13 +575,7 @@ class Game:
         card_id = action.params.get("card_id")
         
         # 查找卡牌
-        card = None
-        card_index = -1
-        for i, c in enumerate(player.reserved_cards):
-            if c.card_id == card_id:
-                card = c
-                card_index = i
-                break
+        card = player.get_reserved_card(card_id)
         
         if card is None or not player.can_afford_card(card):
             return False
@@ -389,15 +584,14 @@ class Game:
         actual_cost = player.get_actual_cost(card)
         
         # 支付宝石
-        for color, count in actual_cost.items():
-            player.gems[color] -= count
-            self.board.gems[color] = self.board.gems.get(color, 0) + count
+        player.gems -= actual_cost
+        self.board.return_gems(actual_cost)
         
         # 从预留卡中移除卡牌
-        player.reserved_cards.pop(card_index)
+        player.remove_reserved_card(card_id)
         
         # 将卡牌添加到玩家的卡牌列表
-        player.cards.append(card)
+        player.add_card(card)
         
         # 检查是否有贵族访问
         self._check_nobles_visit(player)
@@ -416,11 +610,11 @@ class Game:
             # 在AI对战框架中，需要请求代理做出选择
             
             # 临时策略：丢弃随机宝石
-            available_colors = [color for color, count in player.gems.items() if count > 0]
+            available_colors = [i for i, count in enumerate(player.gems.tolist()) if count > 0]
             if not available_colors:
                 break
                 
-            color_to_discard = random.choice(available_colors)
+            color_to_discard = self.rng.choice(available_colors)
             player.gems[color_to_discard] -= 1
             self.board.gems[color_to_discard] += 1
             
@@ -483,24 +677,26 @@ class Game:
         # 如果仍有多个玩家，则他们共同获胜
         self.winner = final_winners
     
-    def play_round(self):
-        """玩家完成一个回合的动作"""
+    def play_round(self, rng: Optional[random.Random] = None):
+        """玩家完成一个回合的动作
+        
+        Args:
+            rng: 随机选择动作使用的随机数生成器，默认使用游戏自己的生成器self.rng
+        """
         if self.game_over:
             return False
         
-        player = self.get_current_player()
-        valid_actions = self.get_valid_actions()
+        # 这里需要由代理选择一个动作
+        # 在实际实现中，会调用代理的选择函数
         
-        if not valid_actions:
+        # 临时策略：随机选择一个动作
+        action = self.sample_random_action(rng)
+        
+        if action is None:
             # 如果没有有效动作，跳过当前玩家
             self.next_player()
             return True
         
-        # 这里需要由代理选择一个动作
-        # 在实际实现中，会调用代理的选择函数
-        
-        # 临时策略：随机选择一个动作
-        action = random.choice(valid_actions)
         success = self.execute_action(action)
         
         if success:
@@ -509,10 +705,14 @@ class Game:
         
         return False
     
-    def play_game(self) -> List[Player]:
-        """模拟完整游戏，返回胜利者"""
+    def play_game(self, rng: Optional[random.Random] = None) -> List[Player]:
+        """模拟完整游戏，返回胜利者
+        
+        Args:
+            rng: 随机选择动作使用的随机数生成器，默认使用游戏自己的生成器self.rng
+        """
         while not self.game_over:
-            self.play_round()
+            self.play_round(rng)
         
         return self.winner
     
@@ -528,9 +728,13 @@ class Game:
             "winner": [player.player_id for player in self.winner] if self.winner else None
         }
     
+    def take_history(self) -> bytes:
+        """取出自上次调用以来新增的历史记录（JSONL格式），并清空缓冲区"""
+        data = self.history_buf.getvalue()
+        self.history_buf = io.BytesIO()
+        return data
+    
     def save_game_history(self, filename: str):
-        """保存游戏历史记录到文件"""
-        from game.serializers import GameJSONEncoder
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.history, f, ensure_ascii=False, indent=2, cls=GameJSONEncoder) 
\ No newline at end of file
+        """保存游戏历史记录到文件（JSONL格式，每行一个动作）"""
+        with open(filename, 'wb') as f:
+            f.write(self.history_buf.getvalue()) 
\ No newline at end of file
@@ -0,0 +1,67 @@
+from game.card import GEM_BITS, GOLD
+
+try:
+    from numba import njit
+except ImportError:  # numba为可选依赖，未安装时以纯Python执行下面的函数
+    njit = None
+
+
+# 是否使用编译后的内核；未安装numba时调用方应传入列表/元组而不是numpy数组，纯Python逐元素访问列表更快
+NUMBA_AVAILABLE = njit is not None
+
+
+def _kernel(func):
+    """安装了numba时将函数编译为机器码（结果缓存到磁盘，避免每个进程重新编译）"""
+    if njit is None:
+        return func
+    return njit(cache=True)(func)
+
+
+@_kernel
+def can_afford(cost, discounts, gems):
+    """判断按GEM_ORDER排列的成本能否用宝石和折扣支付，不足部分由黄金(下标5)补足"""
+    need = 0
+    for i in range(5):
+        avail = gems[i] + discounts[i]
+        if avail < cost[i]:
+            need += cost[i] - avail
+    return need <= gems[5]
+
+
+@_kernel
+def actual_cost(cost, discounts, gems, out):
+    """计算考虑折扣后的实际支付数量，写入长度为6的out并返回"""
+    for i in range(5):
+        remaining = cost[i] - discounts[i]
+        if remaining > 0:
+            paid = min(remaining, gems[i])
+            out[i] = paid
+            remaining -= paid
+            # 不足的部分用黄金补足
+            if remaining > 0:
+                out[5] += min(remaining, gems[5])
+    return out
+
+
+# 打包宝石向量(见card.pack_gems)的SWAR常量：每种颜色占一个6位的通道，通道最高位作为借位保护位
+_LANE_GUARDS = sum(1 << (GEM_BITS * i + GEM_BITS - 1) for i in range(GOLD))
+_LANE_ONES = sum(1 << (GEM_BITS * i) for i in range(GOLD))
+_LANE_MASK = (1 << GEM_BITS) - 1
+
+
+def can_afford_packed(cost_packed: int, available_packed: int, gold: int) -> bool:
+    """用打包的整数无分支、无循环地判断能否支付成本
+    
+    Args:
+        cost_packed: 打包的普通颜色成本
+        available_packed: 打包的普通颜色可用数量（宝石+折扣），每个通道必须小于32
+        gold: 持有的黄金数量
+    """
+    # 每个通道得到 32 + 成本 - 可用数量，可用数量小于32保证通道之间不会借位；保护位仍为1的通道存在缺口
+    diff = (cost_packed | _LANE_GUARDS) - available_packed
+    guards = diff & _LANE_GUARDS
+    # 有缺口的通道保留低5位（缺口数量），其余通道清零
+    shortfall = diff & (guards - (guards >> (GEM_BITS - 1)))
+    # 乘法把各通道的缺口累加到最高的通道中
+    total = (shortfall * _LANE_ONES) >> (GEM_BITS * (GOLD - 1)) & _LANE_MASK
+    return total <= gold
\ No newline at end of file
@@ -1,21 +1,44 @@
-from dataclasses import dataclass
-from typing import Dict
-from game.card import GemColor
+from dataclasses import dataclass, field, replace
+from typing import Dict, Tuple
+from game.card import GemColor, GEM_ORDER
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Noble:
-    """贵族卡类"""
+    """贵族卡类（不可变，可在多局游戏和状态副本之间共享）"""
     points: int  # 贵族提供的胜利点数，通常为3
     requirements: Dict[GemColor, int]  # 获取贵族所需的宝石卡牌数量
     noble_id: str  # 贵族唯一标识符
+    idx: int = field(default=-1, compare=False, repr=False)  # 贵族在STANDARD_NOBLES中的下标，非标准贵族为-1
+    
+    # 以下字段由__post_init__根据requirements等字段派生
+    requirements_vec: Tuple[int, ...] = field(init=False, compare=False, repr=False)  # 按GEM_ORDER排列的要求
+    _as_dict: dict = field(init=False, compare=False, repr=False)  # to_dict的缓存结果
+    
+    def __post_init__(self):
+        object.__setattr__(self, "requirements_vec", tuple(self.requirements.get(color, 0) for color in GEM_ORDER))
+        
+        # 贵族属性在游戏中不会改变，序列化结果只需计算一次
+        object.__setattr__(self, "_as_dict", {
+            "id": self.noble_id,
+            "points": self.points,
+            "requirements": {color.value: count for color, count in self.requirements.items()}
+        })
+    
+    def __deepcopy__(self, memo):
+        # 贵族不可变，复制游戏状态时直接共享同一对象
+        return self
+    
+    def to_dict(self) -> dict:
+        """将贵族转换为字典，用于AI代理理解（返回共享的缓存对象，调用方不应修改）"""
+        return self._as_dict
     
     def __str__(self):
         req_str = ", ".join([f"{color.value}: {count}" for color, count in self.requirements.items() if count > 0])
         return f"贵族[{self.noble_id}] - 点数:{self.points}, 要求:[{req_str}]"
 
 
-def create_standard_nobles() -> list[Noble]:
+def _build_standard_nobles() -> list[Noble]:
     """创建标准游戏中的所有贵族"""
     nobles = [
         Noble(3, {GemColor.WHITE: 4, GemColor.RED: 4}, "N1"),
@@ -29,4 +52,15 @@ def create_standard_nobles() -> list[Noble]:
         Noble(3, {GemColor.WHITE: 4, GemColor.BLUE: 4}, "N9"),
         Noble(3, {GemColor.GREEN: 3, GemColor.RED: 3, GemColor.BLACK: 3}, "N10"),
     ]
-    return nobles 
\ No newline at end of file
+    
+    # 记录每个贵族在标准贵族表中的下标
+    return [replace(noble, idx=idx) for idx, noble in enumerate(nobles)]
+
+
+# 标准贵族只在导入时创建一次，各局游戏共享同一组不可变的贵族对象，按Noble.idx索引
+STANDARD_NOBLES = tuple(_build_standard_nobles())
+
+
+def create_standard_nobles() -> list[Noble]:
+    """获取标准游戏中的所有贵族（返回新列表，可以直接洗牌，其中的贵族对象是共享的）"""
+    return list(STANDARD_NOBLES)
\ No newline at end of file
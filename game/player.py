@@ -1,24 +1,21 @@
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
-from game.card import GemColor, Card
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from game.card import GemColor, Card, GEM_ORDER, COLOR_INDEX, COLOR_NAMES, GOLD, GEM_BITS, CARD_COST, pack_gems
 from game.noble import Noble
+from game.kernels import NUMBA_AVAILABLE, can_afford, actual_cost, can_afford_packed
 
 
-@dataclass
+@dataclass(eq=False)
 class Player:
     """玩家类，表示游戏中的一位玩家"""
     player_id: str  # 玩家唯一标识符
     name: str  # 玩家名称
     
-    # 玩家的宝石代币
-    gems: Dict[GemColor, int] = field(default_factory=lambda: {
-        GemColor.WHITE: 0,
-        GemColor.BLUE: 0,
-        GemColor.GREEN: 0,
-        GemColor.RED: 0,
-        GemColor.BLACK: 0,
-        GemColor.GOLD: 0,
-    })
+    # 玩家的宝石代币，按GEM_ORDER的颜色下标索引，与Board.gems形状相同
+    gems: np.ndarray = field(default_factory=lambda: np.zeros(len(GEM_ORDER), dtype=np.int8))
     
     # 玩家拥有的发展卡
     cards: List[Card] = field(default_factory=list)
@@ -29,54 +26,91 @@ class Player:
     # 玩家拥有的贵族卡
     nobles: List[Noble] = field(default_factory=list)
     
+    def __post_init__(self):
+        self._reindex()
+    
+    def _reindex(self):
+        """根据cards和reserved_cards重建折扣和索引，cards或reserved_cards被整体替换（如恢复快照）后调用"""
+        # 各颜色的卡牌折扣，随cards增量维护，避免每次判断都重新遍历卡牌
+        self._discounts = np.zeros(len(GEM_ORDER), dtype=np.int8)
+        for card in self.cards:
+            self._discounts[card.color_idx] += 1
+        
+        # 打包的折扣（见card.pack_gems），与_discounts同步维护
+        self._discounts_packed = pack_gems(self._discounts.tolist())
+        # 按宝石向量内容缓存的(宝石向量内容, 打包的普通颜色宝石, 黄金数量)
+        self._gems_packed: Optional[Tuple[bytes, int, int]] = None
+        
+        # 预留卡ID到卡牌的索引，与reserved_cards同步维护
+        self._reserved_by_id: Dict[str, Card] = {card.card_id: card for card in self.reserved_cards}
+    
+    def add_card(self, card: Card):
+        """将购买的卡牌加入玩家的卡牌列表，并更新折扣"""
+        self.cards.append(card)
+        self._discounts[card.color_idx] += 1
+        self._discounts_packed += 1 << (GEM_BITS * card.color_idx)
+    
+    def reserve_card(self, card: Card):
+        """将卡牌加入玩家的预留卡"""
+        self.reserved_cards.append(card)
+        self._reserved_by_id[card.card_id] = card
+    
+    def get_reserved_card(self, card_id: str) -> Optional[Card]:
+        """根据卡牌ID查找玩家的预留卡"""
+        return self._reserved_by_id.get(card_id)
+    
+    def remove_reserved_card(self, card_id: str) -> Optional[Card]:
+        """从玩家的预留卡中移除指定卡牌"""
+        card = self._reserved_by_id.pop(card_id, None)
+        if card is not None:
+            self.reserved_cards.remove(card)
+        return card
+    
     def get_gem_count(self, color: GemColor) -> int:
         """获取玩家持有的特定颜色宝石数量"""
-        return self.gems.get(color, 0)
+        return int(self.gems[COLOR_INDEX[color]])
     
     def get_total_gems(self) -> int:
         """获取玩家持有的宝石总数"""
-        return sum(self.gems.values())
+        return int(self.gems.sum())
     
     def get_card_discount(self, color: GemColor) -> int:
         """获取特定颜色的卡牌折扣（玩家拥有的该颜色卡牌数量）"""
-        return sum(1 for card in self.cards if card.gem_color == color)
-    
-    def get_card_discounts(self) -> Dict[GemColor, int]:
-        """获取所有颜色的卡牌折扣"""
-        discounts = {color: 0 for color in GemColor if color != GemColor.GOLD}
-        for card in self.cards:
-            discounts[card.gem_color] = discounts.get(card.gem_color, 0) + 1
-        return discounts
+        return int(self._discounts[COLOR_INDEX[color]])
     
     def can_afford_card(self, card: Card) -> bool:
         """判断玩家是否能够购买特定卡牌"""
-        discounts = self.get_card_discounts()
-        gold_needed = 0
+        if NUMBA_AVAILABLE:
+            return can_afford(card.cost_arr, self._discounts, self.gems)
         
-        for color, cost in card.cost.items():
-            available = self.gems.get(color, 0) + discounts.get(color, 0)
-            if available < cost:
-                gold_needed += cost - available
+        # 未安装numba时用打包整数判断，避免逐颜色循环
+        gems_key = self.gems.tobytes()
+        packed = self._gems_packed
+        if packed is None or packed[0] != gems_key:
+            gems = self.gems.tolist()
+            packed = self._gems_packed = (gems_key, pack_gems(gems), gems[GOLD])
         
-        return gold_needed <= self.gems.get(GemColor.GOLD, 0)
+        return can_afford_packed(card.cost_packed, packed[1] + self._discounts_packed, packed[2])
     
-    def get_actual_cost(self, card: Card) -> Dict[GemColor, int]:
-        """计算购买卡牌的实际成本（考虑折扣）"""
-        discounts = self.get_card_discounts()
-        actual_cost = {}
-        
-        for color, cost in card.cost.items():
-            discount = discounts.get(color, 0)
-            remaining_cost = max(0, cost - discount)
-            if remaining_cost > 0:
-                actual_cost[color] = min(remaining_cost, self.gems.get(color, 0))
-                remaining_cost -= actual_cost[color]
-                if remaining_cost > 0 and self.gems.get(GemColor.GOLD, 0) > 0:
-                    gold_needed = min(remaining_cost, self.gems.get(GemColor.GOLD, 0))
-                    if gold_needed > 0:
-                        actual_cost[GemColor.GOLD] = actual_cost.get(GemColor.GOLD, 0) + gold_needed
+    def get_affordable_mask(self, card_idx: np.ndarray) -> np.ndarray:
+        """批量判断玩家能否购买一组标准卡牌
         
-        return actual_cost
+        Args:
+            card_idx: 卡牌在标准卡牌表中的下标(Card.idx)
+            
+        Returns:
+            np.ndarray: 与card_idx等长的布尔数组
+        """
+        available = np.add(self.gems[:GOLD], self._discounts[:GOLD])
+        shortfall = np.maximum(CARD_COST[card_idx] - available, 0).sum(axis=1)
+        return shortfall <= self.gems[GOLD]
+    
+    def get_actual_cost(self, card: Card) -> np.ndarray:
+        """计算购买卡牌的实际成本（考虑折扣），返回按颜色下标索引的支付数量向量"""
+        if NUMBA_AVAILABLE:
+            return actual_cost(card.cost_arr, self._discounts, self.gems, np.zeros(len(GEM_ORDER), dtype=np.int8))
+        payment = actual_cost(card.cost_vec, self._discounts.tolist(), self.gems.tolist(), [0] * len(GEM_ORDER))
+        return np.array(payment, dtype=np.int8)
     
     def get_score(self) -> int:
         """计算玩家的当前分数"""
@@ -86,14 +120,15 @@ class Player:
     
     def can_be_visited_by_noble(self, noble: Noble) -> bool:
         """判断玩家是否满足贵族的访问条件"""
-        discounts = self.get_card_discounts()
-        for color, requirement in noble.requirements.items():
-            if discounts.get(color, 0) < requirement:
+        discounts = self._discounts.tolist()
+        requirements = noble.requirements_vec
+        for i in range(GOLD):
+            if discounts[i] < requirements[i]:
                 return False
         return True
     
     def __str__(self):
-        gems_str = ", ".join([f"{color.value}: {count}" for color, count in self.gems.items() if count > 0])
+        gems_str = ", ".join([f"{color_name}: {count}" for color_name, count in zip(COLOR_NAMES, self.gems.tolist()) if count > 0])
         cards_count = len(self.cards)
         reserved_count = len(self.reserved_cards)
         nobles_count = len(self.nobles)
@@ -103,39 +138,15 @@ class Player:
                 f"卡牌:{cards_count}, 预留卡:{reserved_count}, 贵族:{nobles_count}")
                 
     def to_dict(self) -> dict:
-        """将玩家状态转换为字典，用于AI代理理解"""
+        """将玩家状态转换为字典，用于AI代理理解（其中的卡牌和贵族字典是共享的，调用方不应修改）"""
         return {
             "player_id": self.player_id,
             "name": self.name,
             "score": self.get_score(),
-            "gems": {color.value: count for color, count in self.gems.items()},
-            "cards": [
-                {
-                    "id": card.card_id,
-                    "level": card.level,
-                    "points": card.points,
-                    "color": card.gem_color.value,
-                    "cost": {color.value: count for color, count in card.cost.items()}
-                } 
-                for card in self.cards
-            ],
-            "reserved_cards": [
-                {
-                    "id": card.card_id,
-                    "level": card.level,
-                    "points": card.points,
-                    "color": card.gem_color.value,
-                    "cost": {color.value: count for color, count in card.cost.items()}
-                } 
-                for card in self.reserved_cards
-            ],
-            "nobles": [
-                {
-                    "id": noble.noble_id,
-                    "points": noble.points,
-                    "requirements": {color.value: count for color, count in noble.requirements.items()}
-                }
-                for noble in self.nobles
-            ],
-            "card_discounts": {color.value: count for color, count in self.get_card_discounts().items()}
+            "gems": dict(zip(COLOR_NAMES, self.gems.tolist())),
+            # 卡牌和贵族的字典在创建时已缓存，这里只引用共享的缓存对象
+            "cards": [card.to_dict() for card in self.cards],
+            "reserved_cards": [card.to_dict() for card in self.reserved_cards],
+            "nobles": [noble.to_dict() for noble in self.nobles],
+            "card_discounts": dict(zip(COLOR_NAMES[:GOLD], self._discounts.tolist()))
         } 
\ No newline at end of file
@@ -1,6 +1,12 @@
 import json
 from enum import Enum
 
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时回退到标准库json
+    orjson = None
+
+
 class GameJSONEncoder(json.JSONEncoder):
     """自定义JSON编码器，用于处理游戏中的特殊类型"""
     
@@ -14,4 +20,64 @@ class GameJSONEncoder(json.JSONEncoder):
             return obj.to_dict()
             
         # 使用基类处理其他情况
-        return super().default(obj) 
\ No newline at end of file
+        return super().default(obj) 
+
+
+def _orjson_default(obj):
+    """orjson无法直接序列化的类型的回调"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def to_json_bytes(obj, indent: bool = True) -> bytes:
+    """将对象序列化为UTF-8编码的JSON
+    
+    安装了orjson时使用orjson，否则使用标准库json；两者输出格式一致
+    （非ASCII字符原样保留，indent为True时缩进2个空格）
+    
+    Args:
+        obj: 要序列化的对象
+        indent: 是否缩进输出
+    
+    Returns:
+        bytes: JSON数据
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_orjson_default, option=option)
+    
+    return to_json(obj, indent).encode('utf-8')
+
+
+def to_json(obj, indent: bool = True) -> str:
+    """将对象序列化为JSON字符串
+    
+    Args:
+        obj: 要序列化的对象
+        indent: 是否缩进输出
+    
+    Returns:
+        str: JSON字符串
+    """
+    if orjson is not None:
+        return to_json_bytes(obj, indent).decode('utf-8')
+    
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, cls=GameJSONEncoder)
+
+
+def from_json(data):
+    """解析JSON字符串、字节或memoryview，安装了orjson时使用orjson
+    
+    Raises:
+        ValueError: 输入不是合法的JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    
+    # 标准库json不接受memoryview，需要先复制为bytes
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
\ No newline at end of file
@@ -3,55 +3,155 @@
 
 import os
 import sys
-import json
 import argparse
 import time
-import random
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 
-import openai
 from rich.console import Console
 
-from game.game import Game
-from game.player import Player
-from agents.base_agent import BaseAgent
-from agents.llm_agent import LLMAgent
-from ui.renderer import GameRenderer
-from evaluation.evaluator import Evaluator
 from utils.config_loader import load_config, get_model_config, get_game_settings, get_evaluation_settings, get_available_models
-from utils.llm_factory import create_llm_client
 
+# 游戏逻辑、代理和LLM客户端（openai）导入较慢，在用到它们的子命令中才导入，list-models和--help无需等待
+if TYPE_CHECKING:
+    from game.game import Game
+    from agents.base_agent import BaseAgent
+    from agents.llm_agent import LLMAgent
+    from ui.renderer import GameRenderer
 
-class RandomAgent(BaseAgent):
-    """随机代理，随机选择动作"""
-    
-    def select_action(self, game_state: Dict[str, Any], valid_actions: List[Any]) -> Any:
-        """随机选择一个动作"""
-        return random.choice(valid_actions) if valid_actions else None
-    
-    def select_gems_to_discard(self, game_state: Dict[str, Any], gems: Dict[str, int], num_to_discard: int) -> Dict[str, int]:
-        """随机选择要丢弃的宝石"""
-        result = {}
-        colors = [color for color, count in gems.items() if count > 0]
+
+async def _play_game(game: "Game", agents: List["BaseAgent"], renderer: Optional["GameRenderer"], console: Console, delay: float):
+    """运行游戏直到结束；代理决策以异步方式等待，LLM请求期间不阻塞事件循环；renderer为None时不渲染游戏状态"""
+    from utils.llm_factory import create_async_http_session
+    
+    # 所有代理共享同一个HTTP连接池，复用keep-alive连接
+    async with create_async_http_session() as session:
+        for agent in agents:
+            agent.bind_http_session(session)
         
-        for _ in range(num_to_discard):
-            if not colors:
-                break
-            color = random.choice(colors)
-            result[color] = result.get(color, 0) + 1
-            gems[color] -= 1
-            if gems[color] <= 0:
-                colors.remove(color)
+        # 玩家ID到代理的映射在游戏开始前建立一次，每回合直接查找
+        agent_by_player = {agent._player.player_id: agent for agent in agents}
         
-        return result
-    
-    def select_noble(self, game_state: Dict[str, Any], available_nobles: List[Dict[str, Any]]) -> str:
-        """随机选择一个贵族"""
-        return random.choice(available_nobles)["id"] if available_nobles else None
+        try:
+            while not game.game_over:
+                current_player = game.get_current_player()
+                current_agent = agent_by_player.get(current_player.player_id)
+                
+                if current_agent:
+                    console.print(f"\n[bold green]{current_player.name}[/bold green] 的回合:")
+                    
+                    # 回合开始
+                    game_state = game.get_game_state()
+                    current_agent.on_turn_start(game_state)
+                    
+                    # 获取有效动作
+                    valid_actions = game.get_valid_actions()
+                    
+                    if valid_actions:
+                        # 让代理选择动作；渲染时流式输出LLM生成的内容
+                        start_time = time.time()
+                        if renderer is not None and hasattr(current_agent, "select_action_streaming"):
+                            selected_action = await current_agent.select_action_streaming(
+                                game_state, valid_actions,
+                                lambda text: console.print(text, end="", markup=False, highlight=False)
+                            )
+                            console.print()
+                        else:
+                            selected_action = await current_agent.select_action_async(game_state, valid_actions)
+                        end_time = time.time()
+                        
+                        # 记录决策时间
+                        decision_time = end_time - start_time
+                        console.print(f"决策时间: {decision_time:.2f}秒")
+                        
+                        # 显示选择的动作
+                        if renderer is not None:
+                            renderer.render_action(current_player, str(selected_action))
+                        else:
+                            console.print(f"{current_player.name} 执行: {selected_action}")
+                        
+                        # 执行动作
+                        success = game.execute_action(selected_action)
+                        
+                        # 回合结束
+                        game_state = game.get_game_state()
+                        current_agent.on_turn_end(game_state, selected_action, success)
+                    else:
+                        console.print("没有有效动作，跳过")
+                
+                # 进入下一个玩家
+                game.next_player()
+                
+                # 更新渲染
+                if renderer is not None:
+                    renderer.render()
+                
+                # 如果命令行参数中指定了延迟，则等待
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            for agent in agents:
+                agent.bind_http_session(None)
+
+
+def _resolve_temperature(args, model_config: Dict[str, Any]) -> float:
+    """确定LLM温度参数：确定性模式固定为0，否则命令行参数优先于配置文件"""
+    if args.deterministic:
+        return 0.0
+    return args.temperature if args.temperature is not None else model_config.get("temperature", 0.5)
+
+
+def _with_small_model(agent: "LLMAgent", small_model: str, config: Dict[str, Any], console: Console,
+                      batched: bool = False) -> "BaseAgent":
+    """提供小模型名称时，用路由代理包装LLM代理，简单决策交给小模型完成"""
+    from agents.llm_agent import LLMAgent
+    from agents.batch_dispatcher import BatchLLMDispatcher
+    from agents.router_agent import RouterAgent
+    from utils.llm_factory import create_llm_client
+    
+    if not small_model:
+        return agent
+    
+    model_config = get_model_config(config, small_model)
+    if not model_config:
+        console.print(f"[bold red]错误: 未找到小模型'{small_model}'的配置，所有决策由主模型完成[/bold red]")
+        return agent
+    
+    llm_client = create_llm_client(model_config)
+    small_agent = LLMAgent(
+        player_id=agent.player_id,
+        name=f"{agent.name} ({model_config.get('name')})",
+        llm_client=llm_client,
+        temperature=agent.temperature,
+        dispatcher=BatchLLMDispatcher(llm_client) if batched else None,
+        persistent_cache=agent.persistent_cache
+    )
+    return RouterAgent(agent, small_agent)
+
+
+def _print_prompt_cache_stats(agents: List["BaseAgent"], console: Console):
+    """输出各LLM代理的提示前缀缓存命中情况；共享同一客户端的代理只输出一次"""
+    seen_clients = set()
+    for agent in agents:
+        llm_client = getattr(agent, "llm_client", None)
+        stats = getattr(llm_client, "usage_stats", None)
+        if not stats or not stats["prompt_tokens"] or id(llm_client) in seen_clients:
+            continue
+        seen_clients.add(id(llm_client))
+        console.print(f"{agent.name} 提示缓存命中: {stats['cached_prompt_tokens']}/{stats['prompt_tokens']} 输入令牌 "
+                      f"({llm_client.get_cache_hit_rate()*100:.1f}%)")
 
 
 def run_game(args):
     """运行单个游戏"""
+    from game.game import Game
+    from game.player import Player
+    from agents.llm_agent import LLMAgent
+    from agents.random_agent import RandomAgent
+    from ui.renderer import GameRenderer
+    from evaluation.llm_cache import open_response_cache
+    from utils.llm_factory import create_llm_client
+    
     console = Console()
     
     # 加载配置
@@ -69,10 +169,14 @@ def run_game(args):
     seed = args.seed or game_settings.get("seed")
     delay = args.delay or game_settings.get("delay", 0.5)
     save_history = args.save_history or game_settings.get("save_history", False)
+    small_model = args.small_model or game_settings.get("small_model")
     
     # 创建代理
     agents = []
     
+    # 确定性模式下温度固定为0，重复出现的局面直接复用磁盘上缓存的LLM响应
+    response_cache = open_response_cache() if args.deterministic else None
+    
     # 获取要使用的模型列表
     model_names = []
     
@@ -86,7 +190,8 @@ def run_game(args):
             model_names.append(args.model)
             
     # 如果没有指定足够的模型，使用默认模型或第一个模型重复填充
-    default_model = args.model or get_available_models(config)[0] if get_available_models(config) else None
+    available_models = get_available_models(config)
+    default_model = args.model or available_models[0] if available_models else None
     while len(model_names) < args.num_llm_agents and default_model:
         model_names.append(default_model)
     
@@ -112,16 +217,14 @@ def run_game(args):
                 console.print(f"[cyan]创建LLM客户端: 类型={model_config.get('type')}, 模型={model_config.get('model_name')}[/cyan]")
                 llm_client = create_llm_client(model_config)
                 
-                # 使用配置的温度参数，如果命令行指定则优先使用命令行参数
-                temperature = args.temperature if args.temperature is not None else model_config.get("temperature", 0.5)
-                
                 agent = LLMAgent(
                     player_id=f"llm_agent_{i+1}",
                     name=f"{model_config.get('name')} 代理",
                     llm_client=llm_client,
-                    temperature=temperature
+                    temperature=_resolve_temperature(args, model_config),
+                    persistent_cache=response_cache
                 )
-                agents.append(agent)
+                agents.append(_with_small_model(agent, small_model, config, console))
                 console.print(f"[green]已成功创建LLM代理: {model_config.get('name')}[/green]")
             except Exception as e:
                 console.print(f"[bold red]创建LLM代理失败 ({model_name}): {e}[/bold red]")
@@ -165,55 +268,13 @@ def run_game(args):
     for agent in agents:
         agent.on_game_start(game_state)
     
-    # 初始渲染
-    renderer.render()
-    
-    # 运行游戏直到结束
-    while not game.game_over:
-        current_player = game.get_current_player()
-        current_agent = next((a for a in agents if a._player == current_player), None)
-        
-        if current_agent:
-            console.print(f"\n[bold green]{current_player.name}[/bold green] 的回合:")
-            
-            # 回合开始
-            game_state = game.get_game_state()
-            current_agent.on_turn_start(game_state)
-            
-            # 获取有效动作
-            valid_actions = game.get_valid_actions()
-            
-            if valid_actions:
-                # 让代理选择动作
-                start_time = time.time()
-                selected_action = current_agent.select_action(game_state, valid_actions)
-                end_time = time.time()
-                
-                # 记录决策时间
-                decision_time = end_time - start_time
-                console.print(f"决策时间: {decision_time:.2f}秒")
-                
-                # 显示选择的动作
-                renderer.render_action(current_player, str(selected_action))
-                
-                # 执行动作
-                success = game.execute_action(selected_action)
-                
-                # 回合结束
-                game_state = game.get_game_state()
-                current_agent.on_turn_end(game_state, selected_action, success)
-            else:
-                console.print("没有有效动作，跳过")
-        
-        # 进入下一个玩家
-        game.next_player()
-        
-        # 更新渲染
-        renderer.render()
-        
-        # 如果命令行参数中指定了延迟，则等待
-        if delay > 0:
-            time.sleep(delay)
+    # 运行游戏直到结束；渲染时在同一块显示区域实时刷新游戏状态
+    if args.no_render:
+        asyncio.run(_play_game(game, agents, None, console, delay))
+    else:
+        with renderer.live():
+            renderer.render()
+            asyncio.run(_play_game(game, agents, renderer, console, delay))
     
     # 游戏结束
     renderer.render_game_over()
@@ -225,17 +286,79 @@ def run_game(args):
     for agent in agents:
         agent.on_game_end(game_state, winner_ids)
     
+    _print_prompt_cache_stats(agents, console)
+    
     # 保存游戏历史
     if save_history:
         os.makedirs("results", exist_ok=True)
         timestamp = int(time.time())
-        history_file = os.path.join("results", f"game_history_{timestamp}.json")
+        history_file = os.path.join("results", f"game_history_{timestamp}.jsonl")
         game.save_game_history(history_file)
         console.print(f"\n游戏历史已保存到: {history_file}")
 
 
+def _create_eval_agent(model_config: Dict[str, Any], args, response_cache: Any) -> "LLMAgent":
+    """创建评估使用的LLM代理，异步请求经由批量调度器发送"""
+    from agents.llm_agent import LLMAgent
+    from agents.batch_dispatcher import BatchLLMDispatcher
+    from utils.llm_factory import create_llm_client
+    
+    llm_client = create_llm_client(model_config)
+    return LLMAgent(
+        player_id="llm_agent",
+        name=f"{model_config.get('name')}",
+        llm_client=llm_client,
+        temperature=_resolve_temperature(args, model_config),
+        dispatcher=BatchLLMDispatcher(llm_client),
+        persistent_cache=response_cache
+    )
+
+
+def _select_quantized_model(model_config: Dict[str, Any], args, seed: Optional[int], workers: int,
+                            response_cache: Any, console: Console) -> Dict[str, Any]:
+    """返回使用quantized_model_name的模型配置
+    
+    args.quantized_warmup_games大于0时，先让原模型和量化模型分别与随机代理进行相同种子的热身对局，
+    量化模型的胜率下降超过args.max_quantized_win_rate_drop时仍使用原模型配置
+    """
+    from agents.random_agent import RandomAgent
+    from evaluation.evaluator import Evaluator
+    
+    quantized_name = model_config.get("quantized_model_name")
+    if not quantized_name:
+        console.print(f"[yellow]模型'{model_config.get('name')}'未配置quantized_model_name，使用原模型[/yellow]")
+        return model_config
+    
+    # 复制一份配置，load_config返回的配置是共享的
+    quantized_config = dict(model_config, model_name=quantized_name)
+    if args.quantized_warmup_games <= 0:
+        return quantized_config
+    
+    win_rates = []
+    for candidate in (model_config, quantized_config):
+        console.print(f"[cyan]热身对局: {candidate['model_name']}[/cyan]")
+        agent = _create_eval_agent(candidate, args, response_cache)
+        evaluator = Evaluator([agent, RandomAgent(player_id="random_agent", name="随机代理")],
+                              num_games=args.quantized_warmup_games, seed=seed, max_concurrency=workers,
+                              checkpoint_file=None)
+        results = evaluator.run_evaluation(output_dir=os.path.join("results", "quantization_warmup"))
+        win_rates.append(results["summary"]["agent_performance"][type(agent).__name__]["win_rate"])
+    
+    drop = win_rates[0] - win_rates[1]
+    console.print(f"热身胜率: 原模型 {win_rates[0]*100:.1f}%, 量化模型 {win_rates[1]*100:.1f}%")
+    if drop > args.max_quantized_win_rate_drop:
+        console.print(f"[yellow]量化模型胜率下降{drop*100:.1f}个百分点，超过上限，改用原模型[/yellow]")
+        return model_config
+    return quantized_config
+
+
 def run_evaluation(args):
     """运行评估"""
+    from agents.random_agent import RandomAgent
+    from evaluation.evaluator import Evaluator
+    from evaluation.llm_cache import open_response_cache
+    from evaluation.offline_batch import OfflineBatchEvaluator
+    
     console = Console()
     console.print("[bold cyan]========== 璀璨宝石 LLM 代理评估 ==========[/bold cyan]")
     
@@ -252,31 +375,54 @@ def run_evaluation(args):
     # 合并命令行参数和配置文件设置
     num_games = args.num_games or eval_settings.get("num_games", 10)
     seed = args.seed or eval_settings.get("seed")
+    workers = args.workers or eval_settings.get("workers", 4)
+    processes = args.processes or eval_settings.get("processes", 1)
+    small_model = args.small_model or eval_settings.get("small_model")
     
     # 创建代理
     agents = []
     
+    # 温度为0时，LLM响应保存到磁盘，使用相同种子重复评估时直接复用
+    response_cache = None if args.no_response_cache else open_response_cache()
+    
     # 获取模型配置
     model_config = get_model_config(config, args.model)
     
     if model_config:
         try:
-            # 创建LLM客户端
-            llm_client = create_llm_client(model_config)
-            
-            # 使用配置的温度参数，如果命令行指定则优先使用命令行参数
-            temperature = args.temperature if args.temperature is not None else model_config.get("temperature", 0.5)
+            # 使用配置的量化模型，热身对局中胜率明显下降时回退到原模型
+            if args.quantized:
+                model_config = _select_quantized_model(model_config, args, seed, workers, response_cache, console)
             
-            agent = LLMAgent(
-                player_id="llm_agent",
-                name=f"{model_config.get('name')}",
-                llm_client=llm_client,
-                temperature=temperature
-            )
-            agents.append(agent)
+            agents.append(_create_eval_agent(model_config, args, response_cache))
         except Exception as e:
             console.print(f"[bold red]创建LLM代理失败：{e}[/bold red]")
     
+    # 离线批量评估：采样局面后通过Batch API一次性提交所有请求
+    if args.offline_batch:
+        if not agents or not hasattr(agents[0].llm_client, "client"):
+            console.print("[bold red]离线批量评估需要一个基于OpenAI API的LLM代理[/bold red]")
+            return
+        
+        llm_agent = agents[0]
+        offline_evaluator = OfflineBatchEvaluator(llm_agent, num_positions=args.num_positions, seed=seed)
+        try:
+            results = offline_evaluator.run(llm_agent.llm_client.client, llm_agent.llm_client.model_name)
+        except RuntimeError as e:
+            console.print(f"[bold red]离线批量评估失败：{e}[/bold red]")
+            return
+        
+        console.print("\n[bold yellow]离线批量评估结果:[/bold yellow]")
+        console.print(f"  局面数: {results['num_positions']}, 收到响应: {results['num_responses']}")
+        console.print(f"  动作解析成功率: {results['parse_rate']*100:.1f}%")
+        for action_type, count in results["action_types"].items():
+            console.print(f"  {action_type}: {count}")
+        return
+    
+    # 简单决策路由到小模型
+    if agents:
+        agents[0] = _with_small_model(agents[0], small_model, config, console, batched=True)
+    
     # 添加随机代理
     agent = RandomAgent(
         player_id="random_agent",
@@ -285,7 +431,8 @@ def run_evaluation(args):
     agents.append(agent)
     
     # 创建评估器
-    evaluator = Evaluator(agents, num_games=num_games, seed=seed)
+    evaluator = Evaluator(agents, num_games=num_games, seed=seed, max_concurrency=workers,
+                          speculative_prefetch=args.speculative_prefetch, processes=processes)
     
     # 运行评估
     results = evaluator.run_evaluation()
@@ -299,6 +446,27 @@ def run_evaluation(args):
         console.print(f"  平均分数: {data['average_score']:.2f}")
         console.print(f"  平均排名: {data['average_rank']:.2f}")
         console.print("")
+    
+    _print_prompt_cache_stats(agents, console)
+
+
+def _check_connections(models: List[Dict[str, Any]], max_workers: int = 8) -> List[str]:
+    """并发测试所有模型的API连接，按模型顺序返回结果描述
+    
+    每个模型发送一次测试请求，各模型的测试互不依赖，在线程池中同时进行
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.llm_factory import create_llm_client
+    
+    def check(model_config: Dict[str, Any]) -> str:
+        try:
+            create_llm_client(model_config).verify_connection()
+            return "[green]成功[/green]"
+        except Exception as e:
+            return f"[red]失败: {e}[/red]"
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(models))) as executor:
+        return list(executor.map(check, models))
 
 
 def list_models(args):
@@ -327,8 +495,11 @@ def list_models(args):
     table.add_column("类型", style="green")
     table.add_column("模型标识", style="blue")
     table.add_column("API可用", style="yellow")
+    if args.check:
+        table.add_column("连接测试", style="magenta")
+        connection_results = _check_connections(models)
     
-    for model in models:
+    for model_index, model in enumerate(models):
         name = model.get("name", "未命名")
         model_type = model.get("type", "未知")
         model_id = model.get("model_name", "未知")
@@ -337,7 +508,10 @@ def list_models(args):
         api_key = model.get("api_key") or os.environ.get(f"{model_type.upper()}_API_KEY")
         api_status = "[green]是[/green]" if api_key else "[red]否[/red]"
         
-        table.add_row(name, model_type, model_id, api_status)
+        if args.check:
+            table.add_row(name, model_type, model_id, api_status, connection_results[model_index])
+        else:
+            table.add_row(name, model_type, model_id, api_status)
     
     console.print(table)
 
@@ -361,6 +535,9 @@ def main():
     game_parser.add_argument("--temperature", type=float, help="LLM温度参数")
     game_parser.add_argument("--num-llm-agents", type=int, default=1, help="LLM代理数量")
     game_parser.add_argument("--save-history", action="store_true", help="保存游戏历史")
+    game_parser.add_argument("--no-render", action="store_true", help="不渲染游戏状态，只输出每回合的动作")
+    game_parser.add_argument("--small-model", type=str, help="处理简单决策（有效动作不超过2个、丢弃宝石、选择贵族）的小模型名称")
+    game_parser.add_argument("--deterministic", action="store_true", help="温度固定为0，并在磁盘上缓存LLM响应供重复局面复用")
     
     # 为每个可能的LLM代理添加特定的模型参数
     for i in range(1, 5):  # 支持最多4个LLM代理
@@ -372,9 +549,21 @@ def main():
     eval_parser.add_argument("--seed", type=int, help="随机种子")
     eval_parser.add_argument("--model", type=str, help="使用的LLM模型名称")
     eval_parser.add_argument("--temperature", type=float, help="LLM温度参数")
+    eval_parser.add_argument("--no-response-cache", action="store_true", help="不使用磁盘上的LLM响应缓存")
+    eval_parser.add_argument("--small-model", type=str, help="处理简单决策（有效动作不超过2个、丢弃宝石、选择贵族）的小模型名称")
+    eval_parser.add_argument("--quantized", action="store_true", help="使用模型配置中quantized_model_name指定的量化模型")
+    eval_parser.add_argument("--quantized-warmup-games", type=int, default=10, help="启用量化模型前与原模型比较胜率的热身对局数量，0表示不比较")
+    eval_parser.add_argument("--max-quantized-win-rate-drop", type=float, default=0.05, help="量化模型允许的最大胜率下降，超过时回退到原模型")
+    eval_parser.add_argument("--deterministic", action="store_true", help="温度固定为0，使相同局面的LLM响应可以被缓存复用")
+    eval_parser.add_argument("--offline-batch", action="store_true", help="采样局面并通过OpenAI Batch API离线批量评估动作选择")
+    eval_parser.add_argument("--num-positions", type=int, default=100, help="离线批量评估采样的局面数量")
+    eval_parser.add_argument("--workers", type=int, help="同时等待中的代理决策(LLM请求)数量上限，默认为4")
+    eval_parser.add_argument("--processes", type=int, help="并行模拟游戏的进程数量，只对不持有网络连接的代理（如随机代理）生效，默认为1")
+    eval_parser.add_argument("--speculative-prefetch", action="store_true", help="等待当前决策时按预测的动作为下一位玩家预取决策")
     
     # 列出模型
     list_parser = subparsers.add_parser("list-models", help="列出可用的模型")
+    list_parser.add_argument("--check", action="store_true", help="并发测试所有模型的API连接")
     
     args = parser.parse_args()
     
@@ -0,0 +1,56 @@
+import random
+
+from game.game import ActionType, Game
+from game.player import Player
+
+
+def _new_game(seed: int) -> Game:
+    players = [Player("p1", "玩家1"), Player("p2", "玩家2")]
+    return Game(players, seed=seed, enable_history=False)
+
+
+def _play_until_last_round(game: Game, rng: random.Random, max_turns: int = 1000):
+    """优先购买卡牌，否则随机行动，直到触发最后一轮"""
+    for _ in range(max_turns):
+        if game.last_round:
+            return
+        actions = game.get_valid_actions()
+        buys = [action for action in actions if action.action_type in (ActionType.BUY_CARD, ActionType.BUY_RESERVED_CARD)]
+        if actions:
+            game.execute_action(rng.choice(buys or actions))
+        game.next_player()
+    raise AssertionError("未能触发最后一轮")
+
+
+def test_restore_final_round_snapshot_into_new_game():
+    """最后一轮的快照恢复到新游戏后，应与原游戏在同一位玩家的回合结束"""
+    game = _new_game(seed=11)
+    _play_until_last_round(game, random.Random(11))
+    assert not game.game_over
+    snapshot = game.snapshot()
+    assert len(snapshot) == game.snapshot_size()
+    
+    # 快照不包含游戏自己的随机数生成器（超出宝石上限时用于丢弃），单独复制其状态
+    restored = _new_game(seed=0)
+    restored.restore(snapshot)
+    restored.rng.setstate(game.rng.getstate())
+    assert restored.last_round
+    assert restored.last_player_index == game.last_player_index
+    
+    expected = game.play_game(random.Random(5))
+    winners = restored.play_game(random.Random(5))
+    assert restored.game_over
+    assert restored.current_player_index == game.current_player_index
+    assert restored.round_number == game.round_number
+    assert [player.player_id for player in winners] == [player.player_id for player in expected]
+
+
+def test_restore_resets_last_player_index():
+    """恢复到尚未触发最后一轮的快照时，不保留其他对局分支的最后一轮状态"""
+    game = _new_game(seed=3)
+    snapshot = game.snapshot()
+    _play_until_last_round(game, random.Random(3))
+    
+    game.restore(snapshot)
+    assert not game.last_round
+    assert game.last_player_index == -1
\ No newline at end of file
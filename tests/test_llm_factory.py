@@ -0,0 +1,36 @@
+import asyncio
+
+from utils import llm_factory
+from utils.llm_factory import OpenAIClient, create_async_http_session
+
+
+def _close(session):
+    asyncio.run(session.aclose())
+
+
+def test_bind_http_session_keeps_proxy_client():
+    """配置了代理的客户端绑定共享连接池后仍使用自身带代理的连接"""
+    client = OpenAIClient({"api_key": "sk-test", "http_proxy": "http://127.0.0.1:8888"})
+    own_http_client = client.async_client._client
+    session = create_async_http_session()
+    try:
+        client.bind_http_session(session)
+        assert client.async_client is client._own_async_client
+        assert client.async_client._client is own_http_client
+    finally:
+        _close(session)
+
+
+def test_bind_http_session_without_proxy(monkeypatch):
+    """未配置代理的客户端绑定后使用共享连接池，解除绑定后恢复自身的连接"""
+    monkeypatch.setattr(llm_factory, "_HTTP_PROXY", None)
+    monkeypatch.setattr(llm_factory, "_HTTPS_PROXY", None)
+    client = OpenAIClient({"api_key": "sk-test"})
+    session = create_async_http_session()
+    try:
+        client.bind_http_session(session)
+        assert client.async_client._client is session
+        client.bind_http_session(None)
+        assert client.async_client is client._own_async_client
+    finally:
+        _close(session)
\ No newline at end of file
@@ -1,6 +1,8 @@
 import json
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Any
 from rich.console import Console
+from rich.live import Live
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
@@ -9,21 +11,21 @@ from rich.box import ROUNDED
 
 from game.game import Game
 from game.player import Player
-from game.card import GemColor
+from game.card import GEM_ORDER, COLOR_NAMES, GOLD
 
 
 class GameRenderer:
     """游戏状态可视化渲染器"""
     
-    # 颜色映射
-    COLOR_MAP = {
-        GemColor.WHITE.value: "bright_white",
-        GemColor.BLUE.value: "blue",
-        GemColor.GREEN.value: "green",
-        GemColor.RED.value: "red",
-        GemColor.BLACK.value: "bright_black",
-        GemColor.GOLD.value: "yellow"
-    }
+    # 各颜色的显示样式，按GEM_ORDER的下标索引
+    COLOR_STYLES = ("bright_white", "blue", "green", "red", "bright_black", "yellow")
+    
+    # 宝石代币表的列标题，按GEM_ORDER的下标索引
+    COLUMN_TITLES = ("白色", "蓝色", "绿色", "红色", "黑色", "黄金")
+    
+    # 预先拼好的各颜色标记，格式化时只需填入数量
+    COLOR_LABELS = tuple(f"[{style}]{name}[/]" for style, name in zip(COLOR_STYLES, COLOR_NAMES))
+    COUNT_PREFIXES = tuple(f"[{style}]{name}: " for style, name in zip(COLOR_STYLES, COLOR_NAMES))
     
     def __init__(self, game: Game):
         """初始化渲染器
@@ -33,32 +35,59 @@ class GameRenderer:
         """
         self.game = game
         self.console = Console()
-    
-    def render(self):
-        """渲染当前游戏状态"""
-        layout = Layout()
         
-        layout.split(
+        # 布局只构建一次，之后每回合只替换发生变化的部分
+        self.layout = Layout()
+        self.layout.split(
             Layout(name="header", size=3),
             Layout(name="main")
         )
-        
-        layout["main"].split_row(
+        self.layout["main"].split_row(
             Layout(name="board", ratio=2),
             Layout(name="players", ratio=1)
         )
         
+        # 上次渲染时游戏板和玩家的状态摘要，未变化时沿用之前的面板
+        self._board_key = None
+        self._players_key = None
+        
+        # 实时刷新的显示区域，为None时每次渲染都输出到控制台
+        self._live: Optional[Live] = None
+    
+    @contextmanager
+    def live(self, refresh_per_second: float = 4):
+        """在上下文中实时刷新同一块显示区域，render()只更新布局，不再重复输出"""
+        with Live(self.layout, console=self.console, refresh_per_second=refresh_per_second) as live:
+            self._live = live
+            try:
+                yield self
+            finally:
+                self._live = None
+    
+    def render(self):
+        """渲染当前游戏状态"""
         # 渲染标题
-        layout["header"].update(self._render_header())
+        self.layout["header"].update(self._render_header())
         
         # 渲染游戏板
-        layout["board"].update(self._render_board())
+        board = self.game.board
+        board_key = (board.gems.tobytes(), board.displayed_version, len(board.nobles),
+                     tuple(len(deck) for deck in board.card_decks.values()))
+        if board_key != self._board_key:
+            self._board_key = board_key
+            self.layout["board"].update(self._render_board())
         
         # 渲染玩家信息
-        layout["players"].update(self._render_players())
+        players_key = (self.game.current_player_index, self.game.game_over,
+                       tuple((player.gems.tobytes(), player.get_score(), len(player.cards),
+                              len(player.reserved_cards), len(player.nobles)) for player in self.game.players))
+        if players_key != self._players_key:
+            self._players_key = players_key
+            self.layout["players"].update(self._render_players())
         
-        # 输出到控制台
-        self.console.print(layout)
+        # 输出到控制台；实时显示时由Live按刷新频率重绘
+        if self._live is None:
+            self.console.print(self.layout)
     
     def _render_header(self) -> Panel:
         """渲染游戏标题和回合信息"""
@@ -90,21 +119,10 @@ class GameRenderer:
         
         # 渲染宝石
         gems_table = Table(title="宝石代币", box=ROUNDED, border_style="cyan")
-        gems_table.add_column("白色", style=self.COLOR_MAP[GemColor.WHITE.value])
-        gems_table.add_column("蓝色", style=self.COLOR_MAP[GemColor.BLUE.value])
-        gems_table.add_column("绿色", style=self.COLOR_MAP[GemColor.GREEN.value])
-        gems_table.add_column("红色", style=self.COLOR_MAP[GemColor.RED.value])
-        gems_table.add_column("黑色", style=self.COLOR_MAP[GemColor.BLACK.value])
-        gems_table.add_column("黄金", style=self.COLOR_MAP[GemColor.GOLD.value])
+        for title, style in zip(self.COLUMN_TITLES, self.COLOR_STYLES):
+            gems_table.add_column(title, style=style)
         
-        gems_table.add_row(
-            str(board.gems.get(GemColor.WHITE, 0)),
-            str(board.gems.get(GemColor.BLUE, 0)),
-            str(board.gems.get(GemColor.GREEN, 0)),
-            str(board.gems.get(GemColor.RED, 0)),
-            str(board.gems.get(GemColor.BLACK, 0)),
-            str(board.gems.get(GemColor.GOLD, 0))
-        )
+        gems_table.add_row(*map(str, board.gems.tolist()))
         
         layout["gems"].update(gems_table)
         
@@ -124,18 +142,11 @@ class GameRenderer:
             cards_table.add_column("成本")
             
             for card in board.displayed_cards.get(level, []):
-                # 格式化成本
-                cost_str = ""
-                for color, count in card.cost.items():
-                    if count > 0:
-                        color_name = color.value
-                        cost_str += f"[{self.COLOR_MAP.get(color_name, 'white')}]{color_name}: {count}[/] "
-                
                 cards_table.add_row(
                     card.card_id,
                     str(card.points),
-                    f"[{self.COLOR_MAP.get(card.gem_color.value, 'white')}]{card.gem_color.value}[/]",
-                    cost_str
+                    self.COLOR_LABELS[card.color_idx],
+                    self._format_gem_vec(card.cost_vec)
                 )
             
             cards_layout[f"level{level}"].update(cards_table)
@@ -149,17 +160,10 @@ class GameRenderer:
         nobles_table.add_column("要求")
         
         for noble in board.nobles:
-            # 格式化要求
-            req_str = ""
-            for color, count in noble.requirements.items():
-                if count > 0:
-                    color_name = color.value
-                    req_str += f"[{self.COLOR_MAP.get(color_name, 'white')}]{color_name}: {count}[/] "
-            
             nobles_table.add_row(
                 noble.noble_id,
                 str(noble.points),
-                req_str
+                self._format_gem_vec(noble.requirements_vec)
             )
         
         layout["nobles"].update(nobles_table)
@@ -191,21 +195,10 @@ class GameRenderer:
             player_table.add_row("分数", f"[bold]{player.get_score()}[/bold]")
             
             # 添加宝石信息
-            gems_str = ""
-            for color, count in player.gems.items():
-                if count > 0:
-                    color_name = color.value
-                    gems_str += f"[{self.COLOR_MAP.get(color_name, 'white')}]{color_name}: {count}[/] "
-            player_table.add_row("宝石", gems_str)
+            player_table.add_row("宝石", self._format_gem_vec(player.gems.tolist()))
             
             # 添加卡牌折扣信息
-            discounts = player.get_card_discounts()
-            discount_str = ""
-            for color, count in discounts.items():
-                if count > 0:
-                    color_name = color.value
-                    discount_str += f"[{self.COLOR_MAP.get(color_name, 'white')}]{color_name}: {count}[/] "
-            player_table.add_row("卡牌折扣", discount_str)
+            player_table.add_row("卡牌折扣", self._format_gem_vec([player.get_card_discount(color) for color in GEM_ORDER[:GOLD]]))
             
             # 添加卡牌信息
             cards_str = f"共 {len(player.cards)} 张"
@@ -227,6 +220,11 @@ class GameRenderer:
         
         return Panel(layout, title="玩家信息", border_style="blue")
     
+    def _format_gem_vec(self, vec) -> str:
+        """格式化按GEM_ORDER排列的宝石数量，省略数量为0的颜色"""
+        prefixes = self.COUNT_PREFIXES
+        return "".join(f"{prefixes[i]}{count}[/] " for i, count in enumerate(vec) if count > 0)
+    
     def render_action(self, player: Player, action_str: str, success: bool = True):
         """渲染玩家执行的动作
         
@@ -1,34 +1,92 @@
 import os
-import json
-from typing import Dict, Any, List, Optional
+import mmap
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional, Sequence, Tuple
 
+from game.serializers import from_json
 
-def load_config(config_path: str = "config.json") -> Dict[str, Any]:
+
+# 超过该大小的配置文件通过内存映射解析，避免把整个文件读入一份堆上的副本
+_MMAP_THRESHOLD = 64 * 1024
+
+# 已解析的配置文件，键为绝对路径，值为((修改时间, 文件大小), 配置数据)
+_CONFIG_CACHE: Dict[str, Tuple[Tuple[int, int], Mapping[str, Any]]] = {}
+
+
+def load_config(config_path: str = "config.json") -> Mapping[str, Any]:
     """
-    加载配置文件
+    加载配置文件；文件的修改时间和大小不变时直接返回上次解析的结果，文件被修改后重新解析
     
     Args:
         config_path: 配置文件路径
         
     Returns:
-        Dict[str, Any]: 配置数据
+        Mapping[str, Any]: 只读的配置数据，其中的字典为MappingProxyType、列表为元组；
+            文件未修改时多次调用返回同一个对象，需要修改时先复制（如dict(model_config, ...)）
     """
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"配置文件 {config_path} 不存在")
+    path = os.path.abspath(config_path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"配置文件 {config_path} 不存在") from None
+    
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _CONFIG_CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
     
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # 读取原始字节直接解析，安装了orjson时使用orjson；较大的文件映射到内存后直接解析
+    if st.st_size > _MMAP_THRESHOLD:
+        config = _load_mapped(path)
+    else:
+        with open(path, 'rb') as f:
+            config = from_json(f.read())
     
     # 处理环境变量中的API密钥
     for model in config.get("models", []):
-        env_key = f"{model['type'].upper()}_API_KEY"
-        if not model.get("api_key") and env_key in os.environ:
-            model["api_key"] = os.environ[env_key]
+        if not model.get("api_key"):
+            env_value = os.environ.get(f"{model['type'].upper()}_API_KEY")
+            if env_value:
+                model["api_key"] = env_value
     
+    # 冻结后所有调用方可以安全地共享同一个对象
+    config = _freeze(config)
+    models = config.get("models", ())
+    
+    # 按名称索引模型配置，get_model_config直接查表；模型名称列表也只生成一次
+    config = MappingProxyType({
+        **config,
+        "_by_name": MappingProxyType(_index_models(models)),
+        "_names": tuple(model.get("name") for model in models)
+    })
+    
+    _CONFIG_CACHE[path] = (key, config)
     return config
 
 
-def get_model_config(config: Dict[str, Any], model_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+def _freeze(value: Any) -> Any:
+    """递归地把字典转为只读的MappingProxyType，把列表转为元组"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _load_mapped(path: str) -> Dict[str, Any]:
+    """将文件映射到内存后解析；解析结果不引用映射的内存，解析完成后即可关闭映射"""
+    with open(path, 'rb') as f:
+        if hasattr(mmap, "MAP_PRIVATE"):
+            # 支持MAP_POPULATE的平台上映射时预先读入所有页面，避免解析过程中逐页触发缺页
+            mapped = mmap.mmap(f.fileno(), 0, flags=mmap.MAP_PRIVATE | getattr(mmap, "MAP_POPULATE", 0), prot=mmap.PROT_READ)
+        else:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    with mapped, memoryview(mapped) as view:
+        return from_json(view)
+
+
+def get_model_config(config: Mapping[str, Any], model_name: Optional[str] = None) -> Optional[Mapping[str, Any]]:
     """
     根据模型名称获取模型配置
     
@@ -37,7 +95,7 @@ def get_model_config(config: Dict[str, Any], model_name: Optional[str] = None) -
         model_name: 模型名称，如果为None则返回第一个模型配置
         
     Returns:
-        Optional[Dict[str, Any]]: 模型配置或None（如果未找到）
+        Optional[Mapping[str, Any]]: 模型配置或None（如果未找到）
     """
     models = config.get("models", [])
     
@@ -47,14 +105,32 @@ def get_model_config(config: Dict[str, Any], model_name: Optional[str] = None) -
     if model_name is None:
         return models[0]
     
+    by_name = config.get("_by_name")
+    if by_name is not None:
+        return by_name.get(model_name)
+    
+    # 不是由load_config加载的配置没有预先建立的索引，按顺序查找，找到即返回
     for model in models:
-        if model.get("name") == model_name or model.get("model_name") == model_name:
+        if model.get("name") == model_name:
+            return model
+        if model.get("model_name") == model_name:
             return model
     
     return None
 
 
-def get_game_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+def _index_models(models: Sequence[Mapping[str, Any]]) -> Dict[str, Mapping[str, Any]]:
+    """建立名称和模型名到模型配置的索引；名称重复时保留列表中靠前的模型，与按顺序查找的结果一致"""
+    by_name: Dict[str, Mapping[str, Any]] = {}
+    for model in models:
+        for key in ("name", "model_name"):
+            name = model.get(key)
+            if name:
+                by_name.setdefault(name, model)
+    return by_name
+
+
+def get_game_settings(config: Mapping[str, Any]) -> Mapping[str, Any]:
     """
     获取游戏设置
     
@@ -62,12 +138,12 @@ def get_game_settings(config: Dict[str, Any]) -> Dict[str, Any]:
         config: 配置数据
         
     Returns:
-        Dict[str, Any]: 游戏设置
+        Mapping[str, Any]: 游戏设置
     """
     return config.get("game_settings", {})
 
 
-def get_evaluation_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+def get_evaluation_settings(config: Mapping[str, Any]) -> Mapping[str, Any]:
     """
     获取评估设置
     
@@ -75,12 +151,12 @@ def get_evaluation_settings(config: Dict[str, Any]) -> Dict[str, Any]:
         config: 配置数据
         
     Returns:
-        Dict[str, Any]: 评估设置
+        Mapping[str, Any]: 评估设置
     """
     return config.get("evaluation_settings", {})
 
 
-def get_available_models(config: Dict[str, Any]) -> List[str]:
+def get_available_models(config: Mapping[str, Any]) -> Tuple[str, ...]:
     """
     获取可用模型列表
     
@@ -88,6 +164,9 @@ def get_available_models(config: Dict[str, Any]) -> List[str]:
         config: 配置数据
         
     Returns:
-        List[str]: 模型名称列表
+        Tuple[str, ...]: 模型名称（由load_config加载的配置返回预先生成的元组）
     """
-    return [model.get("name") for model in config.get("models", [])] 
\ No newline at end of file
+    names = config.get("_names")
+    if names is None:
+        names = tuple(model.get("name") for model in config.get("models", []))
+    return names 
\ No newline at end of file
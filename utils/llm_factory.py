@@ -1,21 +1,165 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 import os
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
 
-import openai
-from openai import OpenAI, AzureOpenAI
+import httpx
+
+
+# 默认只输出WARNING及以上级别；调试连接问题时可将该日志器的级别设为DEBUG
+logger = logging.getLogger(__name__)
+
+# 环境变量中的代理设置，模块加载时读取一次；模型配置中的http_proxy/https_proxy优先
+_HTTP_PROXY = os.environ.get("HTTP_PROXY")
+_HTTPS_PROXY = os.environ.get("HTTPS_PROXY")
 
 
 class BaseLLMClient:
     """LLM客户端基类"""
     
+    # 内置客户端声明__slots__以省去每个实例的__dict__；未声明__slots__的子类仍可自由添加属性
+    __slots__ = ("usage_stats", "_message_buffers", "_response_cache", "_response_cache_size", "_response_cache_lock")
+    
+    # 批量请求时同时进行中的请求数上限
+    max_concurrency: int = 16
+    
+    def __init__(self, cache_size: int = 1024):
+        """
+        Args:
+            cache_size: 温度为0时缓存的响应数量上限，为0时不缓存
+        """
+        # 累计的令牌用量；cached_prompt_tokens为命中服务端提示前缀缓存的输入令牌数
+        self.usage_stats = {"requests": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+        # 同步调用复用的消息列表，每个线程一份
+        self._message_buffers = threading.local()
+        # 温度为0时的响应缓存，按最近使用顺序排列，超出容量时淘汰最久未使用的响应
+        self._response_cache: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+        self._response_cache_size = cache_size
+        self._response_cache_lock = threading.Lock()
+    
+    def _response_cache_key(self, system_prompt: str, user_prompt: str, temperature: float,
+                            max_tokens: Optional[int]) -> Optional[Tuple[Any, ...]]:
+        """温度为0时返回响应缓存的键；其他温度下生成结果不确定，返回None表示不缓存"""
+        if temperature != 0 or self._response_cache_size <= 0:
+            return None
+        return (getattr(self, "model_name", None), system_prompt, user_prompt, max_tokens)
+    
+    def _get_cached_response(self, key: Optional[Tuple[Any, ...]]) -> Optional[str]:
+        """查找缓存的响应"""
+        if key is None:
+            return None
+        with self._response_cache_lock:
+            response = self._response_cache.get(key)
+            if response is not None:
+                self._response_cache.move_to_end(key)
+        return response
+    
+    def _put_cached_response(self, key: Optional[Tuple[Any, ...]], response: Optional[str]):
+        """缓存响应；调用出错时的空响应不缓存"""
+        if key is None or not response:
+            return
+        with self._response_cache_lock:
+            self._response_cache[key] = response
+            self._response_cache.move_to_end(key)
+            if len(self._response_cache) > self._response_cache_size:
+                self._response_cache.popitem(last=False)
+    
+    def _sync_messages(self, system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+        """填入本次提示后返回当前线程复用的消息列表
+        
+        同步请求返回前SDK已完成序列化，同一线程中的下一次调用可以安全地覆盖内容；
+        异步调用可能在同一线程中交错进行，不能使用这个列表
+        """
+        messages = getattr(self._message_buffers, "messages", None)
+        if messages is None:
+            messages = self._message_buffers.messages = [{"role": "system", "content": ""}, {"role": "user", "content": ""}]
+        messages[0]["content"] = system_prompt
+        messages[1]["content"] = user_prompt
+        return messages
+    
+    def _record_usage(self, response: Any):
+        """累计响应中返回的令牌用量"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        
+        stats = self.usage_stats
+        stats["requests"] += 1
+        stats["prompt_tokens"] += usage.prompt_tokens or 0
+        stats["completion_tokens"] += usage.completion_tokens or 0
+        # 较旧的API版本和SDK不返回缓存命中信息
+        details = getattr(usage, "prompt_tokens_details", None)
+        stats["cached_prompt_tokens"] += getattr(details, "cached_tokens", None) or 0
+    
+    def get_cache_hit_rate(self) -> float:
+        """输入令牌中命中提示前缀缓存的比例"""
+        prompt_tokens = self.usage_stats["prompt_tokens"]
+        return self.usage_stats["cached_prompt_tokens"] / prompt_tokens if prompt_tokens else 0.0
+    
+    def verify_connection(self):
+        """发送一次测试请求检查API连接，失败时抛出ValueError；默认不做检查"""
+        pass
+    
     def get_completion(self, system_prompt: str, user_prompt: str, temperature: float = 0.5, max_tokens: int = 500) -> str:
         """获取LLM的完成结果"""
         raise NotImplementedError("子类必须实现此方法")
+    
+    async def get_completion_async(self, system_prompt: str, user_prompt: str,
+                                   temperature: Optional[float] = None,
+                                   max_tokens: Optional[int] = None) -> str:
+        """异步获取LLM的完成结果，默认在线程中执行同步调用"""
+        return await asyncio.to_thread(self.get_completion, system_prompt, user_prompt, temperature, max_tokens)
+    
+    async def get_completion_batch_async(self, prompts: List[Tuple[str, str]],
+                                         temperature: Optional[float] = None,
+                                         max_tokens: Optional[int] = None) -> List[str]:
+        """并发获取多组提示的完成结果，同时进行中的请求不超过max_concurrency个
+        
+        Args:
+            prompts: (系统提示, 用户提示)列表
+            temperature: 温度参数，如果为None则使用配置值
+            max_tokens: 最大生成令牌数，如果为None则使用配置值
+            
+        Returns:
+            List[str]: 与prompts顺序一致的生成文本
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def complete(system_prompt: str, user_prompt: str) -> str:
+            async with semaphore:
+                return await self.get_completion_async(system_prompt, user_prompt, temperature, max_tokens)
+        
+        return list(await asyncio.gather(*[complete(system_prompt, user_prompt) for system_prompt, user_prompt in prompts]))
+    
+    def get_completion_batch(self, prompts: List[Tuple[str, str]],
+                             temperature: Optional[float] = None,
+                             max_tokens: Optional[int] = None) -> List[str]:
+        """get_completion_batch_async的同步版本，在新的事件循环中运行，不能在事件循环内调用"""
+        return asyncio.run(self.get_completion_batch_async(prompts, temperature, max_tokens))
+    
+    async def stream_completion_async(self, system_prompt: str, user_prompt: str,
+                                      temperature: Optional[float] = None,
+                                      max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """流式获取LLM的完成结果，随生成逐段产出文本；调用方提前关闭迭代器时中止生成
+        
+        默认一次性产出完整结果
+        """
+        yield await self.get_completion_async(system_prompt, user_prompt, temperature, max_tokens)
+    
+    def bind_http_session(self, session: Optional[httpx.AsyncClient]):
+        """让异步调用复用外部共享的HTTP连接池，session为None时恢复使用自身的连接；默认不做处理"""
+        pass
 
 
 class OpenAIClient(BaseLLMClient):
     """OpenAI API客户端"""
     
+    __slots__ = ("api_key", "model_name", "base_url", "temperature", "max_tokens", "max_concurrency",
+                 "http_proxy", "https_proxy", "client", "async_client", "_own_async_client", "_async_client_kwargs",
+                 "_proxies")
+    
     def __init__(self, config: Dict[str, Any]):
         """
         初始化OpenAI客户端
@@ -23,16 +167,20 @@ class OpenAIClient(BaseLLMClient):
         Args:
             config: 模型配置
         """
-        self.api_key = config.get("api_key")
-        if not self.api_key:
+        # 缺少API密钥时在分配任何资源之前失败
+        api_key = config.get("api_key")
+        if not api_key:
             raise ValueError("未提供API密钥，请在配置文件中设置api_key或通过环境变量提供")
-            
+        
+        super().__init__(config.get("cache_size", 1024))
+        self.api_key = api_key
         self.model_name = config.get("model_name", "gpt-3.5-turbo")
         self.base_url = config.get("base_url")
         self.temperature = config.get("temperature", 0.5)
         self.max_tokens = config.get("max_tokens", 500)
-        self.http_proxy = config.get("http_proxy") or os.environ.get("HTTP_PROXY")
-        self.https_proxy = config.get("https_proxy") or os.environ.get("HTTPS_PROXY")
+        self.max_concurrency = config.get("max_concurrency", BaseLLMClient.max_concurrency)
+        self.http_proxy = config.get("http_proxy") or _HTTP_PROXY
+        self.https_proxy = config.get("https_proxy") or _HTTPS_PROXY
         
         # 配置OpenAI客户端
         client_kwargs = {
@@ -42,6 +190,7 @@ class OpenAIClient(BaseLLMClient):
             client_kwargs["base_url"] = self.base_url
             
         # 配置代理
+        proxies = None
         if self.http_proxy or self.https_proxy:
             proxies = {}
             if self.http_proxy:
@@ -49,22 +198,28 @@ class OpenAIClient(BaseLLMClient):
             if self.https_proxy:
                 proxies["https"] = self.https_proxy
             
-            print(f"使用代理设置: {proxies}")
-            try:
-                import httpx
-                client_kwargs["http_client"] = httpx.Client(proxies=proxies)
-            except (ImportError, TypeError) as e:
-                print(f"无法设置代理 (使用httpx): {e}")
-                # 不阻止继续运行，只是不使用代理
+            logger.info("使用代理设置: %s", proxies)
             
-        print(f"初始化OpenAI客户端: model={self.model_name}, base_url={self.base_url}")
+        logger.debug("初始化OpenAI客户端: model=%s, base_url=%s", self.model_name, self.base_url)
+        
+        # openai导入较慢，只在创建客户端时导入，不使用LLM的场景（如只有随机代理的评估）无需承担导入开销
+        from openai import OpenAI, AsyncOpenAI
+        
+        # 创建客户端，同步和异步调用各自使用一个保持keep-alive的连接池
+        self.client = OpenAI(**client_kwargs, http_client=_create_http_client(httpx.Client, proxies))
+        self.async_client = AsyncOpenAI(**client_kwargs, http_client=_create_http_client(httpx.AsyncClient, proxies))
+        self._own_async_client = self.async_client
+        self._async_client_kwargs = client_kwargs
+        self._proxies = proxies
         
+        # 测试连接需要一次完整的请求往返，默认不在创建时测试，连接问题在第一次实际请求时暴露
+        if config.get("verify_on_init", False):
+            self.verify_connection()
+    
+    def verify_connection(self):
+        """发送一次测试请求检查API连接，失败时抛出ValueError"""
         try:
-            # 创建客户端
-            self.client = OpenAI(**client_kwargs)
-            
-            # 测试连接
-            print("测试API连接...")
+            logger.debug("测试API连接...")
             response = self.client.chat.completions.create(
                 model=self.model_name,
                 messages=[
@@ -73,9 +228,9 @@ class OpenAIClient(BaseLLMClient):
                 ],
                 max_tokens=10
             )
-            print(f"API连接成功! 响应: {response.choices[0].message.content}")
+            logger.debug("API连接成功! 响应: %s", response.choices[0].message.content)
         except Exception as e:
-            print(f"API连接测试失败: {e}")
+            logger.debug("API连接测试失败: %s", e)
             raise ValueError(f"无法连接到OpenAI API: {e}")
     
     def get_completion(self, system_prompt: str, user_prompt: str, 
@@ -96,8 +251,54 @@ class OpenAIClient(BaseLLMClient):
         temp = temperature if temperature is not None else self.temperature
         tokens = max_tokens if max_tokens is not None else self.max_tokens
         
+        # 温度为0时相同的提示得到相同的响应，直接复用缓存
+        key = self._response_cache_key(system_prompt, user_prompt, temp, tokens)
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+        
         try:
             response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._sync_messages(system_prompt, user_prompt),
+                temperature=temp,
+                max_tokens=tokens
+            )
+        except Exception as e:
+            logger.error("OpenAI API调用出错: %s", e)
+            return ""
+        
+        self._record_usage(response)
+        content = response.choices[0].message.content
+        self._put_cached_response(key, content)
+        return content
+    
+    async def get_completion_async(self, system_prompt: str, user_prompt: str,
+                                   temperature: Optional[float] = None,
+                                   max_tokens: Optional[int] = None) -> str:
+        """
+        异步获取OpenAI模型的完成结果
+        
+        Args:
+            system_prompt: 系统提示
+            user_prompt: 用户提示
+            temperature: 温度参数，如果为None则使用配置值
+            max_tokens: 最大生成令牌数，如果为None则使用配置值
+            
+        Returns:
+            str: 模型生成的文本
+        """
+        temp = temperature if temperature is not None else self.temperature
+        tokens = max_tokens if max_tokens is not None else self.max_tokens
+        
+        # 温度为0时相同的提示得到相同的响应，直接复用缓存
+        key = self._response_cache_key(system_prompt, user_prompt, temp, tokens)
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self.async_client.chat.completions.create(
                 model=self.model_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -106,15 +307,81 @@ class OpenAIClient(BaseLLMClient):
                 temperature=temp,
                 max_tokens=tokens
             )
-            return response.choices[0].message.content
         except Exception as e:
-            print(f"OpenAI API调用出错: {e}")
+            logger.error("OpenAI API调用出错: %s", e)
             return ""
+        
+        self._record_usage(response)
+        content = response.choices[0].message.content
+        self._put_cached_response(key, content)
+        return content
+    
+    async def stream_completion_async(self, system_prompt: str, user_prompt: str,
+                                      temperature: Optional[float] = None,
+                                      max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        流式获取OpenAI模型的完成结果
+        
+        Args:
+            system_prompt: 系统提示
+            user_prompt: 用户提示
+            temperature: 温度参数，如果为None则使用配置值
+            max_tokens: 最大生成令牌数，如果为None则使用配置值
+            
+        Yields:
+            str: 模型新生成的文本片段
+        """
+        temp = temperature if temperature is not None else self.temperature
+        tokens = max_tokens if max_tokens is not None else self.max_tokens
+        
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temp,
+                max_tokens=tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        except Exception as e:
+            logger.error("OpenAI API调用出错: %s", e)
+            return
+        
+        # 调用方提前关闭时关闭响应流，服务端随即停止生成
+        try:
+            async for chunk in stream:
+                # 用量在最后一个不含choices的片段中返回
+                if chunk.usage is not None:
+                    self._record_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error("OpenAI API调用出错: %s", e)
+        finally:
+            await stream.close()
+    
+    def bind_http_session(self, session: Optional[httpx.AsyncClient]):
+        """让异步调用复用外部共享的HTTP连接池，session为None时恢复使用自身的连接"""
+        if self._proxies:
+            # 配置了代理时继续使用自身带代理的连接，共享连接池不带代理
+            return
+        
+        if session is None:
+            self.async_client = self._own_async_client
+        else:
+            from openai import AsyncOpenAI
+            self.async_client = AsyncOpenAI(**self._async_client_kwargs, http_client=session)
 
 
 class AzureOpenAIClient(BaseLLMClient):
     """Azure OpenAI API客户端"""
     
+    __slots__ = ("api_key", "model_name", "base_url", "api_version", "deployment_name", "temperature", "max_tokens",
+                 "max_concurrency", "client", "async_client", "_own_async_client", "_async_client_kwargs", "_proxies")
+    
     def __init__(self, config: Dict[str, Any]):
         """
         初始化Azure OpenAI客户端
@@ -122,13 +389,20 @@ class AzureOpenAIClient(BaseLLMClient):
         Args:
             config: 模型配置
         """
-        self.api_key = config.get("api_key")
+        # 缺少凭据时在分配任何资源之前失败；未配置api_key时SDK会读取环境变量中的API密钥或Azure AD令牌
+        api_key = config.get("api_key")
+        if not (api_key or os.environ.get("AZURE_OPENAI_API_KEY") or os.environ.get("AZURE_OPENAI_AD_TOKEN")):
+            raise ValueError("未提供API密钥，请在配置文件中设置api_key或通过环境变量提供")
+        
+        super().__init__(config.get("cache_size", 1024))
+        self.api_key = api_key
         self.model_name = config.get("model_name", "gpt-35-turbo")
         self.base_url = config.get("base_url")
         self.api_version = config.get("api_version", "2023-05-15")
         self.deployment_name = config.get("deployment_name")
         self.temperature = config.get("temperature", 0.5)
         self.max_tokens = config.get("max_tokens", 500)
+        self.max_concurrency = config.get("max_concurrency", BaseLLMClient.max_concurrency)
         
         # 配置Azure OpenAI客户端
         client_kwargs = {
@@ -139,14 +413,26 @@ class AzureOpenAIClient(BaseLLMClient):
         if self.base_url:
             client_kwargs["azure_endpoint"] = self.base_url
             
-        print(f"初始化Azure OpenAI客户端: model={self.model_name}, endpoint={self.base_url}")
+        logger.debug("初始化Azure OpenAI客户端: model=%s, endpoint=%s", self.model_name, self.base_url)
         
+        from openai import AzureOpenAI, AsyncAzureOpenAI
+        
+        # 创建客户端，同步和异步调用各自使用一个保持keep-alive的连接池
+        self.client = AzureOpenAI(**client_kwargs, http_client=_create_http_client(httpx.Client))
+        self.async_client = AsyncAzureOpenAI(**client_kwargs, http_client=_create_http_client(httpx.AsyncClient))
+        self._own_async_client = self.async_client
+        self._async_client_kwargs = client_kwargs
+        # Azure客户端不单独配置代理
+        self._proxies = None
+        
+        # 与OpenAI客户端相同，只在配置了verify_on_init时创建后立即测试连接
+        if config.get("verify_on_init", False):
+            self.verify_connection()
+    
+    def verify_connection(self):
+        """发送一次测试请求检查API连接，失败时抛出ValueError"""
         try:
-            # 创建客户端
-            self.client = AzureOpenAI(**client_kwargs)
-            
-            # 测试连接
-            print("测试Azure API连接...")
+            logger.debug("测试Azure API连接...")
             response = self.client.chat.completions.create(
                 deployment_name=self.deployment_name,
                 messages=[
@@ -155,9 +441,9 @@ class AzureOpenAIClient(BaseLLMClient):
                 ],
                 max_tokens=10
             )
-            print(f"Azure API连接成功! 响应: {response.choices[0].message.content}")
+            logger.debug("Azure API连接成功! 响应: %s", response.choices[0].message.content)
         except Exception as e:
-            print(f"Azure API连接测试失败: {e}")
+            logger.debug("Azure API连接测试失败: %s", e)
             raise ValueError(f"无法连接到Azure OpenAI API: {e}")
     
     def get_completion(self, system_prompt: str, user_prompt: str, 
@@ -175,40 +461,242 @@ class AzureOpenAIClient(BaseLLMClient):
         Returns:
             str: 模型生成的文本
         """
+        temp = temperature if temperature is not None else self.temperature
+        tokens = max_tokens if max_tokens is not None else self.max_tokens
+        
+        # 温度为0时相同的提示得到相同的响应，直接复用缓存
+        key = self._response_cache_key(system_prompt, user_prompt, temp, tokens)
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+        
         try:
             response = self.client.chat.completions.create(
+                deployment_name=self.deployment_name,
+                messages=self._sync_messages(system_prompt, user_prompt),
+                temperature=temp,
+                max_tokens=tokens
+            )
+        except Exception as e:
+            logger.error("Azure OpenAI API调用出错: %s", e)
+            return ""
+        
+        self._record_usage(response)
+        content = response.choices[0].message.content
+        self._put_cached_response(key, content)
+        return content
+    
+    async def get_completion_async(self, system_prompt: str, user_prompt: str,
+                                   temperature: Optional[float] = None,
+                                   max_tokens: Optional[int] = None) -> str:
+        """
+        异步获取Azure OpenAI模型的完成结果
+        
+        Args:
+            system_prompt: 系统提示
+            user_prompt: 用户提示
+            temperature: 温度参数，如果为None则使用配置值
+            max_tokens: 最大生成令牌数，如果为None则使用配置值
+            
+        Returns:
+            str: 模型生成的文本
+        """
+        temp = temperature if temperature is not None else self.temperature
+        tokens = max_tokens if max_tokens is not None else self.max_tokens
+        
+        # 温度为0时相同的提示得到相同的响应，直接复用缓存
+        key = self._response_cache_key(system_prompt, user_prompt, temp, tokens)
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self.async_client.chat.completions.create(
                 deployment_name=self.deployment_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                temperature=temperature if temperature is not None else self.temperature,
-                max_tokens=max_tokens if max_tokens is not None else self.max_tokens
+                temperature=temp,
+                max_tokens=tokens
             )
-            
-            return response.choices[0].message.content
         except Exception as e:
-            print(f"Azure OpenAI API调用出错: {e}")
+            logger.error("Azure OpenAI API调用出错: %s", e)
             return ""
+        
+        self._record_usage(response)
+        content = response.choices[0].message.content
+        self._put_cached_response(key, content)
+        return content
+    
+    async def stream_completion_async(self, system_prompt: str, user_prompt: str,
+                                      temperature: Optional[float] = None,
+                                      max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        流式获取Azure OpenAI模型的完成结果
+        
+        Args:
+            system_prompt: 系统提示
+            user_prompt: 用户提示
+            temperature: 温度参数，如果为None则使用配置值
+            max_tokens: 最大生成令牌数，如果为None则使用配置值
+            
+        Yields:
+            str: 模型新生成的文本片段
+        """
+        try:
+            stream = await self.async_client.chat.completions.create(
+                deployment_name=self.deployment_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temperature if temperature is not None else self.temperature,
+                max_tokens=max_tokens if max_tokens is not None else self.max_tokens,
+                stream=True
+            )
+        except Exception as e:
+            logger.error("Azure OpenAI API调用出错: %s", e)
+            return
+        
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error("Azure OpenAI API调用出错: %s", e)
+        finally:
+            await stream.close()
+    
+    def bind_http_session(self, session: Optional[httpx.AsyncClient]):
+        """让异步调用复用外部共享的HTTP连接池，session为None时恢复使用自身的连接"""
+        if self._proxies:
+            # 配置了代理时继续使用自身带代理的连接，共享连接池不带代理
+            return
+        
+        if session is None:
+            self.async_client = self._own_async_client
+        else:
+            from openai import AsyncAzureOpenAI
+            self.async_client = AsyncAzureOpenAI(**self._async_client_kwargs, http_client=session)
+
+
+# LLM客户端自身连接池的大小；空闲连接保持30秒，连续的请求复用同一条TLS连接
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30.0)
+
+
+def _with_http2(client_class: type, **kwargs) -> Any:
+    """创建HTTP客户端，安装了h2时启用HTTP/2，多个并发请求可复用同一条连接"""
+    try:
+        return client_class(http2=True, **kwargs)
+    except ImportError:
+        # 未安装h2，使用HTTP/1.1连接池
+        return client_class(**kwargs)
+
+
+def _create_http_client(client_class: type, proxies: Optional[Dict[str, str]] = None) -> Any:
+    """
+    创建LLM客户端使用的HTTP客户端
+    
+    Args:
+        client_class: httpx.Client或httpx.AsyncClient
+        proxies: 按协议配置的代理地址
+        
+    Returns:
+        Any: client_class的实例
+    """
+    if proxies:
+        try:
+            return _with_http2(client_class, limits=_HTTP_LIMITS, proxies=proxies)
+        except TypeError as e:
+            logger.warning("无法设置代理 (使用httpx): %s", e)
+            # 不阻止继续运行，只是不使用代理
+    return _with_http2(client_class, limits=_HTTP_LIMITS)
 
 
-def create_llm_client(config: Dict[str, Any]) -> BaseLLMClient:
+def create_async_http_session(max_connections: int = 64, max_keepalive_connections: int = 32) -> httpx.AsyncClient:
+    """
+    创建供多个LLM客户端共享的异步HTTP连接池
+    
+    连接保持keep-alive以复用TLS连接；安装了h2时启用HTTP/2，多个并发请求可复用同一条连接
+    
+    Args:
+        max_connections: 最大连接数
+        max_keepalive_connections: 最大保持的空闲连接数
+        
+    Returns:
+        httpx.AsyncClient: 异步HTTP客户端，需要在使用结束后关闭
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+    return _with_http2(httpx.AsyncClient, limits=limits)
+
+
+# 客户端类型到客户端类的映射，可通过register_llm注册自定义的客户端类型
+_REGISTRY: Dict[str, type] = {
+    "openai": OpenAIClient,
+    "azure_openai": AzureOpenAIClient,
+}
+
+# 共享的LLM客户端，键为创建客户端时实际读取的配置项；只有名称等无关配置项不同的模型复用同一个客户端
+_CLIENT_CACHE: Dict[Tuple[Any, ...], BaseLLMClient] = {}
+
+# 决定内置客户端行为的配置项
+_CLIENT_KEY_FIELDS = ("type", "api_key", "base_url", "model_name", "deployment_name", "api_version",
+                      "temperature", "max_tokens", "max_concurrency", "cache_size", "http_proxy", "https_proxy")
+
+
+def register_llm(name: str, client_class: type):
+    """
+    注册自定义的LLM客户端类型，注册后可在模型配置的type中使用
+    
+    Args:
+        name: 类型名称，不区分大小写
+        client_class: BaseLLMClient的子类，以模型配置为唯一参数创建实例
+    """
+    _REGISTRY[name.lower()] = client_class
+
+
+def create_llm_client(config: Dict[str, Any], shared: bool = True) -> BaseLLMClient:
     """
     根据配置创建LLM客户端
     
     Args:
         config: 模型配置
+        shared: 是否复用之前用相同配置创建的客户端；复用时多个代理共享同一个客户端的连接池和令牌用量统计
         
     Returns:
         BaseLLMClient: LLM客户端实例
     """
     client_type = config.get("type", "").lower()
+    client_class = _REGISTRY.get(client_type)
+    if client_class is None:
+        raise ValueError(f"不支持的LLM类型: {client_type}")
+    
+    key = _client_cache_key(client_class, config) if shared else None
+    if key is None:
+        return _create_llm_client(client_class, config)
     
-    print(f"创建客户端类型: {client_type}")
+    client = _CLIENT_CACHE.get(key)
+    if client is None:
+        # 多个线程同时创建时只保留先写入的客户端
+        client = _CLIENT_CACHE.setdefault(key, _create_llm_client(client_class, config))
+    return client
+
+
+def _client_cache_key(client_class: type, config: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+    """共享客户端的缓存键；自定义客户端读取的配置项未知，使用全部配置项，含有不可哈希的值时返回None"""
+    if client_class in (OpenAIClient, AzureOpenAIClient):
+        return tuple(config.get(field) for field in _CLIENT_KEY_FIELDS)
     
-    if client_type == "openai":
-        return OpenAIClient(config)
-    elif client_type == "azure_openai":
-        return AzureOpenAIClient(config)
-    else:
-        raise ValueError(f"不支持的LLM类型: {client_type}") 
\ No newline at end of file
+    key = (client_class,) + tuple(sorted(config.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _create_llm_client(client_class: type, config: Dict[str, Any]) -> BaseLLMClient:
+    """创建新的LLM客户端"""
+    logger.debug("创建客户端类型: %s", client_class.__name__)
+    return client_class(config)
\ No newline at end of file